@@ -0,0 +1,131 @@
+"""
+Activity Writer Module
+Buffers activity log events in memory and writes them in batched multi-row
+inserts from a background thread, off the request path
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from models import db, ActivityLog
+
+ACTIVITY_QUEUE_SIZE = int(os.getenv('ACTIVITY_QUEUE_SIZE', '10000'))
+ACTIVITY_BATCH_SIZE = int(os.getenv('ACTIVITY_BATCH_SIZE', '200'))
+ACTIVITY_FLUSH_SECONDS = float(os.getenv('ACTIVITY_FLUSH_SECONDS', '2'))
+
+
+class ActivityWriter:
+    """
+    Bounded queue of activity events drained by one writer thread.
+
+    A batch is written when it reaches `batch_size` or when `flush_interval`
+    seconds have passed since its first event. When the queue is full, new
+    events are dropped and counted instead of blocking the request. The thread
+    starts on first use in each process, so it also works after a fork (gunicorn),
+    and whatever is still queued is written at interpreter exit.
+    """
+
+    def __init__(self, app, max_queue=ACTIVITY_QUEUE_SIZE, batch_size=ACTIVITY_BATCH_SIZE,
+                 flush_interval=ACTIVITY_FLUSH_SECONDS):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def log(self, user_id, action, details=None):
+        """Queue an event; never blocks and never touches the request's db session"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait({
+                "user_id": user_id,
+                "action": action,
+                "details": details,
+                "timestamp": datetime.utcnow(),
+            })
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_started(self):
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='activity-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while not self._stop.is_set():
+            timeout = self.flush_interval if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            except queue.Empty:
+                pass
+
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self._write(batch)
+                batch = []
+                deadline = None
+
+        # Shutting down: write what this thread already pulled off the queue
+        if batch:
+            self._write(batch)
+
+    def _drain(self):
+        events = []
+        while True:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                return events
+
+    def _write(self, events):
+        with self._write_lock:
+            try:
+                with self.app.app_context():
+                    db.session.execute(db.insert(ActivityLog), events)
+                    db.session.commit()
+                self.written += len(events)
+            except Exception as e:
+                self.failed += len(events)
+                print(f"Error writing {len(events)} activity log event(s): {e}")
+
+    def flush(self):
+        """Synchronously write everything still queued"""
+        events = self._drain()
+        for i in range(0, len(events), self.batch_size):
+            self._write(events[i:i + self.batch_size])
+
+    def stop(self, timeout=5):
+        """Stop the writer thread and flush the remaining events"""
+        self._stop.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=timeout)
+        self.flush()
+
+    def get_stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
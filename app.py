@@ -1,62 +1,55 @@
-from flask import Flask, render_template, jsonify, request, redirect, url_for, session, abort
+from flask import Flask, Response, render_template, jsonify, request, redirect, url_for, session, abort, stream_with_context, send_from_directory
 from functools import wraps
+import csv
+import hashlib
+import hmac
+import io
 import os
 import random
+import zlib
 from datetime import datetime, timedelta
 from urllib.parse import urlencode
 
-import requests
 import json
-from models import db, User, Funnel, Lead, AutomatedMedia, BetaSignup, ActivityLog, Review, InstagramConnection
-from instagram_api import InstagramAPI, exchange_short_lived_token, refresh_long_lived_token, validate_token, get_recent_mentions
-from cryptography.fernet import Fernet
-import base64
-import hashlib
 
-from werkzeug.security import generate_password_hash, check_password_hash
-
-# Load environment variables
+# Load environment variables before importing modules that read configuration at import time
 try:
     from dotenv import load_dotenv
     load_dotenv()
 except ImportError:
     pass  # dotenv is optional
 
+from models import db, User, Funnel, Lead, AutomatedMedia, BetaSignup, ActivityLog, Review, InstagramConnection, ProcessedComment, TokenUsage, InstagramCache, CommentCursor
+from instagram_api import InstagramAPI, exchange_short_lived_token, refresh_long_lived_token, validate_token, get_recent_mentions, process_webhook_payload
+from database import configure_database, install_engine_hooks
+from encryption import encrypt_password, decrypt_password
+from http_client import get_http_session, get_http_pool_stats
+from activity_writer import ActivityWriter
+from automation import process_comment_batch, parse_wakewords, invalidate_wakeword_matcher
+from lead_stats import get_lead_stats
+from media_import import MediaImportError, import_user_media
+from comment_cursors import advance_comment_cursors
+from instagram_cache import TokenExpired, FetchFailed, get_cached, store_cached, invalidate_instagram_cache
+from capacity import BETA_PLAN_LIMITS, beta_counter, get_counter, get_founding_coupon_usage, try_claim
+from connection_stats import get_connection_totals, get_daily_rollups, record_connection_usage
+from plans import PLAN_LIMITS, get_effective_balance
+from token_ledger import credit_tokens
+from scheduler import PollScheduler
+from webhook_queue import WebhookQueue, WebhookConsumer
+from pagination import keyset_paginate, parse_page_size, parse_date
+from page_cache import page_cache, cached_public_page, PAGE_CACHE_TTL
 
-# Encryption utilities
-ENCRYPTION_KEY = os.getenv('ENCRYPTION_KEY', 'your-secret-key-for-encryption-change-this-in-production')
-
-
-def encrypt_password(password):
-    """Encrypt password using Fernet encryption"""
-    if not password:
-        return None
-    
-    # Use the environment variable as the key, or derive from a default
-    key = hashlib.sha256(ENCRYPTION_KEY.encode()).digest()
-    encoded_key = base64.urlsafe_b64encode(key)
-    f = Fernet(encoded_key)
-    return f.encrypt(password.encode()).decode()
-
-
-def decrypt_password(encrypted_password):
-    """Decrypt password using Fernet encryption"""
-    if not encrypted_password:
-        return None
-    
-    # Use the environment variable as the key, or derive from a default
-    key = hashlib.sha256(ENCRYPTION_KEY.encode()).digest()
-    encoded_key = base64.urlsafe_b64encode(key)
-    f = Fernet(encoded_key)
-    return f.decrypt(encrypted_password.encode()).decode()
+from werkzeug.security import generate_password_hash, check_password_hash
 
 
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///zenflow.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+configure_database(app)
 
 db.init_app(app)
+install_engine_hooks(app, db)
+
+activity_writer = ActivityWriter(app)
 
 with app.app_context():
     try:
@@ -70,38 +63,13 @@ FOUNDING_COUPON_LIMIT = 100  # first 100 paying users
 
 
 def get_founding_usage():
-    return User.query.filter_by(used_founding_coupon=True).count()
+    return get_founding_coupon_usage()
 
 
 def is_founding_coupon_active():
     return get_founding_usage() < FOUNDING_COUPON_LIMIT
 
 
-# Plan-based limits
-PLAN_LIMITS = {
-    "Free": {
-        "allow_media_import": False,
-        "max_active_media": 0,
-        "tokens": 4000
-    },
-    "Starter": {
-        "allow_media_import": True,
-        "max_active_media": 3,
-        "tokens": 10000
-    },
-    "Growth": {
-        "allow_media_import": True,
-        "max_active_media": 10,
-        "tokens": 50000
-    },
-    "Pro": {
-        "allow_media_import": True,
-        "max_active_media": None,
-        "tokens": 200000
-    },
-}
-
-
 def get_user_and_limits():
     """Helper: get current user and their plan limits."""
     uid = session.get('user_id')
@@ -111,9 +79,6 @@ def get_user_and_limits():
     if not user:
         return None, PLAN_LIMITS["Free"]
     
-    # Check and reset tokens if needed
-    check_and_reset_tokens(user)
-    
     plan = getattr(user, "plan", "Free") or "Free"
     limits = PLAN_LIMITS.get(plan, PLAN_LIMITS["Free"])
     return user, limits
@@ -130,29 +95,8 @@ def admin_required(f):
     return decorated_function
 
 def log_activity(user_id, action, details=None):
-    try:
-        log = ActivityLog(user_id=user_id, action=action, details=details)
-        db.session.add(log)
-        db.session.commit()
-    except Exception as e:
-        print(f"Error logging activity: {e}")
-
-
-def check_and_reset_tokens(user):
-    """Refill free tokens according to plan every 30 days."""
-    if not user.tokens_reset_at:
-        user.tokens_reset_at = datetime.utcnow()
-        plan_data = PLAN_LIMITS.get(user.plan, PLAN_LIMITS["Free"])
-        user.free_tokens = plan_data["tokens"]
-        db.session.commit()
-        return
-
-    # If it's been more than 30 days since last reset
-    if datetime.utcnow() > user.tokens_reset_at + timedelta(days=30):
-        plan_data = PLAN_LIMITS.get(user.plan, PLAN_LIMITS["Free"])
-        user.free_tokens = plan_data["tokens"]
-        user.tokens_reset_at = datetime.utcnow()
-        db.session.commit()
+    # Buffered and written in batches by a background thread, outside this request's transaction
+    activity_writer.log(user_id, action, details)
 
 
 # Mock data for niches
@@ -178,12 +122,18 @@ def detect_niche(text):
     return "Unknown"
 
 @app.route('/')
+@cached_public_page
 def home():
     user = None
     if 'user_id' in session:
         user = User.query.get(session['user_id'])
     return render_template('home.html', user=user)
 
+@app.route('/landing')
+def landing_page():
+    """Static agency landing page, revalidated by ETag/Last-Modified"""
+    return send_from_directory(app.root_path, 'landing_page.html', max_age=PAGE_CACHE_TTL)
+
 @app.route('/login')
 def login_ui():
     return render_template('login.html')
@@ -249,7 +199,7 @@ def auth_instagram_callback():
     }
     
     try:
-        response = requests.get(token_url, params=params)
+        response = get_http_session().get(token_url, params=params)
         data = response.json()
         
         if 'access_token' not in data:
@@ -298,7 +248,10 @@ def auth_instagram_callback():
                 # But we requested it in get_user_profile.
                 pass 
                 
+            # A (re)connected account starts with a clean cache
+            invalidate_instagram_cache(user.id)
             db.session.commit()
+            store_cached(user.id, 'profile', profile)
             
             # Generate leads if fresh
             if not Lead.query.filter_by(user_id=user.id).first():
@@ -380,28 +333,20 @@ def get_dashboard_context():
         return None
 
     funnel = Funnel.query.filter_by(user_id=user.id).first()
-    leads = Lead.query.filter_by(user_id=user.id).order_by(Lead.timestamp.desc()).all()
-    active_media = AutomatedMedia.query.filter_by(user_id=user.id).all()
+    active_media = AutomatedMedia.query.filter_by(user_id=user.id).order_by(AutomatedMedia.posted_at.desc(), AutomatedMedia.id.desc()).all()
     
-    # CALCULATE CHART DATA (Last 7 Days)
-    chart_data = []
-    for i in range(6, -1, -1):
-        day = (datetime.utcnow() - timedelta(days=i)).date()
-        count = Lead.query.filter(
-            Lead.user_id == user.id,
-            db.func.date(Lead.timestamp) == day
-        ).count()
-        chart_data.append({"day": day.strftime('%a'), "count": count})
-
-    total_leads = len(leads)
-    booked_leads = Lead.query.filter_by(user_id=user.id, status="Booked").count()
+    # Totals, per-status counts and the 7-day chart come from one grouped query
+    lead_stats = get_lead_stats(user.id)
+    total_leads = lead_stats["total_leads"]
+    booked_leads = lead_stats["status_counts"].get("Booked", 0)
     revenue_roi = booked_leads * 200
     
     stats = {
         "total_leads": total_leads,
+        "status_counts": lead_stats["status_counts"],
         "engagements": f"{total_leads * 12}K",
         "revenue_roi": f"${revenue_roi:,}",
-        "chart_data": chart_data
+        "chart_data": lead_stats["chart_data"]
     }
 
     user_data = {
@@ -414,16 +359,13 @@ def get_dashboard_context():
         "followers": user.followers,
         "following": user.following,
         "instagram_connected": bool(user.ig_user_id),  # Add Instagram connection status
-        "free_tokens": user.free_tokens,
-        "paid_tokens": user.paid_tokens,
-        "total_tokens": user.free_tokens + user.paid_tokens
+        **get_effective_balance(user)
     }
 
     return {
         "user": user_data,
         "stats": stats,
         "funnel": funnel,
-        "leads": leads,
         "active_media": active_media
     }
 
@@ -451,6 +393,64 @@ def analytics():
     if not ctx: return redirect(url_for('login_ui'))
     return render_template('analytics.html', **ctx)
 
+def build_lead_query(user_id, args):
+    """Build a Lead query for a user from optional q/status/from/to request args."""
+    query = Lead.query.filter(Lead.user_id == user_id)
+
+    search = (args.get('q') or '').strip().lstrip('@')
+    if search:
+        pattern = f"%{search}%"
+        query = query.filter(db.or_(Lead.handle.ilike(pattern), Lead.status.ilike(pattern)))
+
+    status = args.get('status')
+    if status:
+        query = query.filter(Lead.status == status)
+
+    start = parse_date(args.get('from'))
+    if start:
+        query = query.filter(Lead.timestamp >= start)
+
+    end = parse_date(args.get('to'))
+    if end:
+        # A bare date means "up to the end of that day"
+        if len(args.get('to')) == 10:
+            end += timedelta(days=1)
+        query = query.filter(Lead.timestamp < end)
+
+    return query
+
+
+def serialize_lead(lead):
+    return {
+        "id": lead.id,
+        "handle": lead.handle,
+        "status": lead.status,
+        "niche_relevance": lead.niche_relevance,
+        "timestamp": lead.timestamp.isoformat() if lead.timestamp else None,
+        "captured": lead.timestamp.strftime('%d %b, %H:%M') if lead.timestamp else ""
+    }
+
+
+@app.route('/api/leads')
+def list_leads():
+    """Keyset-paginated lead listing, newest first"""
+    if 'user_id' not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    query = build_lead_query(session['user_id'], request.args)
+    leads, next_cursor = keyset_paginate(
+        query,
+        Lead.timestamp,
+        Lead.id,
+        cursor=request.args.get('cursor'),
+        limit=parse_page_size(request.args.get('limit'))
+    )
+
+    return jsonify({
+        "leads": [serialize_lead(lead) for lead in leads],
+        "next_cursor": next_cursor
+    })
+
 @app.route('/dashboard/update', methods=['POST'])
 def update_automation():
     if 'user_id' not in session:
@@ -459,12 +459,14 @@ def update_automation():
     user_id = session['user_id']
     funnel = Funnel.query.filter_by(user_id=user_id).first()
     
-    funnel.wakeword = request.form.get('wakeword', 'GROW').upper()
+    # Several wakewords can be given comma-separated, e.g. "GROW, INFO"
+    funnel.wakeword = ', '.join(parse_wakewords(request.form.get('wakeword', 'GROW'))) or 'GROW'
     funnel.script = request.form.get('script', '')
     funnel.link = request.form.get('link', '')
     funnel.active = 'active' in request.form
     
     db.session.commit()
+    invalidate_wakeword_matcher(user_id)
     return redirect(url_for('dashboard'))
 
 @app.route('/api/stats')
@@ -491,28 +493,72 @@ def admin_dashboard():
                           funnels_count=funnels_count,
                           activities=activities)
 
+ADMIN_USERS_PER_PAGE = 50
+
+# Sort keys accepted by /admin/users; id breaks ties so pages are stable
+ADMIN_USER_SORTS = {
+    "newest": (User.id.desc(),),
+    "oldest": (User.id.asc(),),
+    "username": (User.username.asc(), User.id.asc()),
+    "plan": (User.plan.asc(), User.id.desc()),
+    "tokens": ((User.free_tokens + User.paid_tokens).desc(), User.id.desc()),
+}
+
+
 @app.route('/admin/users')
 @admin_required
 def admin_users():
     user = User.query.get(session['user_id'])
-    users = User.query.all()
     
-    # Pre-decrypt passwords for the view
-    users_with_passwords = []
-    for u in users:
-        decrypted = "Not set"
-        if u.ig_password_encrypted:
-            try:
-                decrypted = decrypt_password(u.ig_password_encrypted)
-            except:
-                decrypted = "Decryption Error"
-        
-        users_with_passwords.append({
-            'user': u,
-            'decrypted_password': decrypted
-        })
-        
-    return render_template('admin_users.html', user=user, users=users_with_passwords)
+    search = request.args.get('q', '').strip()
+    plan = request.args.get('plan', '').strip()
+    sort = request.args.get('sort', 'newest')
+    if sort not in ADMIN_USER_SORTS:
+        sort = 'newest'
+    
+    query = User.query
+    if search:
+        pattern = f"%{search}%"
+        query = query.filter(db.or_(
+            User.username.ilike(pattern),
+            User.ig_username.ilike(pattern),
+            User.plan.ilike(pattern)
+        ))
+    if plan:
+        query = query.filter(User.plan == plan)
+    
+    # Passwords are not decrypted here; see reveal_user_password
+    pagination = query.order_by(*ADMIN_USER_SORTS[sort]).paginate(
+        page=request.args.get('page', 1, type=int),
+        per_page=ADMIN_USERS_PER_PAGE,
+        error_out=False
+    )
+    
+    return render_template('admin_users.html',
+                           user=user,
+                           users=pagination.items,
+                           pagination=pagination,
+                           search=search,
+                           plan_filter=plan,
+                           sort=sort,
+                           plans=list(PLAN_LIMITS),
+                           sorts=list(ADMIN_USER_SORTS))
+
+@app.route('/admin/users/<int:user_id>/reveal-password', methods=['POST'])
+@admin_required
+def reveal_user_password(user_id):
+    """Decrypt a single user's stored Instagram password on demand"""
+    user = User.query.get_or_404(user_id)
+    if not user.ig_password_encrypted:
+        return jsonify({"success": False, "error": "Not set"}), 404
+    
+    try:
+        password = decrypt_password(user.ig_password_encrypted)
+    except Exception:
+        return jsonify({"success": False, "error": "Decryption Error"}), 500
+    
+    log_activity(session['user_id'], "Admin: revealed password", f"Viewed Instagram password of @{user.username}")
+    return jsonify({"success": True, "password": password})
 
 @app.route('/admin/users/<int:user_id>/grant-tokens', methods=['POST'])
 @admin_required
@@ -520,8 +566,7 @@ def grant_tokens(user_id):
     user = User.query.get_or_404(user_id)
     amount = request.form.get('amount', type=int)
     if amount and amount > 0:
-        user.paid_tokens += amount
-        db.session.commit()
+        credit_tokens(user.id, "paid_tokens", amount, "admin_grant")
         log_activity(session['user_id'], "Admin: granted tokens", f"Granted {amount:,} tokens to @{user.username}")
         return jsonify({"success": True})
     return jsonify({"success": False, "error": "Invalid amount"}), 400
@@ -553,9 +598,14 @@ def delete_user(user_id):
     Lead.query.filter_by(user_id=user_id).delete()
     AutomatedMedia.query.filter_by(user_id=user_id).delete()
     ActivityLog.query.filter_by(user_id=user_id).delete()
+    ProcessedComment.query.filter_by(user_id=user_id).delete()
+    TokenUsage.query.filter_by(user_id=user_id).delete()
+    InstagramCache.query.filter_by(user_id=user_id).delete()
+    CommentCursor.query.filter_by(user_id=user_id).delete()
     
     db.session.delete(user)
     db.session.commit()
+    invalidate_wakeword_matcher(user_id)
     log_activity(session['user_id'], "Admin: deleted user", f"Deleted user {user.username} (ID: {user_id})")
     return redirect(url_for('admin_users'))
 
@@ -576,8 +626,32 @@ def toggle_admin(user_id):
 @admin_required
 def admin_activities():
     user = User.query.get(session['user_id'])
-    activities = ActivityLog.query.order_by(ActivityLog.timestamp.desc()).all()
-    return render_template('admin_activities.html', user=user, activities=activities)
+    
+    action = request.args.get('action', '').strip()
+    username = request.args.get('user', '').strip().lstrip('@')
+    
+    query = ActivityLog.query.options(db.joinedload(ActivityLog.user))
+    if action:
+        query = query.filter(ActivityLog.action.ilike(f"%{action}%"))
+    if username:
+        filter_user = User.query.filter_by(username=username).first()
+        # An unknown username matches nothing (comparing to None would mean IS NULL)
+        query = query.filter(ActivityLog.user_id == filter_user.id if filter_user else db.false())
+    
+    activities, next_cursor = keyset_paginate(
+        query,
+        ActivityLog.timestamp,
+        ActivityLog.id,
+        cursor=request.args.get('cursor'),
+        limit=parse_page_size(request.args.get('limit'))
+    )
+    return render_template('admin_activities.html',
+                           user=user,
+                           activities=activities,
+                           next_cursor=next_cursor,
+                           action_filter=action,
+                           user_filter=username,
+                           is_first_page=not request.args.get('cursor'))
 
 @app.route('/admin/reviews')
 @admin_required
@@ -590,18 +664,33 @@ def admin_reviews():
 @admin_required
 def admin_instagram_connections():
     user = User.query.get(session['user_id'])
-    connections = InstagramConnection.query.order_by(InstagramConnection.connected_at.desc()).all()
-    
-    total_revenue = sum(conn.revenue for conn in connections)
-    total_tokens_used = sum(conn.tokens_used for conn in connections)
-    active_connections = sum(1 for conn in connections if conn.is_active)
+    connections, next_cursor = keyset_paginate(
+        InstagramConnection.query.options(db.joinedload(InstagramConnection.user)),
+        InstagramConnection.connected_at,
+        InstagramConnection.id,
+        cursor=request.args.get('cursor'),
+        limit=parse_page_size(request.args.get('limit'))
+    )
     
     return render_template('admin_instagram.html', 
                            user=user, 
                            connections=connections,
-                           total_revenue=total_revenue,
-                           total_tokens_used=total_tokens_used,
-                           active_connections=active_connections)
+                           next_cursor=next_cursor,
+                           is_first_page=not request.args.get('cursor'),
+                           daily_stats=get_daily_rollups(),
+                           **get_connection_totals())
+
+@app.route('/admin/metrics')
+@admin_required
+def admin_metrics():
+    """Runtime counters for the background and integration subsystems"""
+    return jsonify({
+        "http_pool": get_http_pool_stats(),
+        "poll_scheduler": poll_scheduler.get_stats(),
+        "webhook_queue": webhook_queue.get_stats(),
+        "activity_writer": activity_writer.get_stats(),
+        "page_cache": page_cache.get_stats()
+    })
 
 @app.route('/api/instagram-connection', methods=['POST'])
 def create_instagram_connection():
@@ -650,16 +739,59 @@ def update_instagram_connection(connection_id):
     
     data = request.get_json()
     
+    old_revenue = connection.revenue or 0.0
+    old_tokens_used = connection.tokens_used or 0
     if 'revenue' in data:
         connection.revenue = data['revenue']
     if 'tokens_used' in data:
         connection.tokens_used = data['tokens_used']
     
+    # Fold the change into today's rollup in the same transaction
+    record_connection_usage(
+        revenue_delta=(connection.revenue or 0.0) - old_revenue,
+        tokens_delta=(connection.tokens_used or 0) - old_tokens_used
+    )
+    
     connection.last_used_at = datetime.utcnow()
     db.session.commit()
     
     return jsonify({"message": "Connection updated"}), 200
 
+def instagram_cache_response(kind):
+    """Serve the user's cached Graph API `kind` in the shape dashboard.html expects"""
+    if 'user_id' not in session:
+        return jsonify({"success": False, "error": "Unauthorized"}), 401
+    
+    user = User.query.get(session['user_id'])
+    if not user or not user.ig_access_token:
+        return jsonify({"success": False, "error": "not_connected"}), 400
+    
+    if user.token_expires_at and user.token_expires_at < datetime.utcnow():
+        if not refresh_long_lived_token(user):
+            return jsonify({"success": False, "error": "token_expired"}), 401
+    
+    try:
+        payload, fetched_at, stale = get_cached(user, kind)
+    except TokenExpired:
+        return jsonify({"success": False, "error": "token_expired"}), 401
+    except FetchFailed as e:
+        return jsonify({"success": False, "error": str(e)}), 502
+    
+    return jsonify({
+        "success": True,
+        kind: payload,
+        "fetched_at": fetched_at.isoformat(),
+        "stale": stale
+    })
+
+@app.route('/api/instagram/profile')
+def instagram_profile():
+    return instagram_cache_response('profile')
+
+@app.route('/api/instagram/media')
+def instagram_media():
+    return instagram_cache_response('media')
+
 @app.route('/submit-review', methods=['POST'])
 def submit_review():
     content = request.form.get('content')
@@ -679,6 +811,7 @@ def submit_review():
     
     db.session.add(new_review)
     db.session.commit()
+    page_cache.invalidate()
     
     return redirect(url_for('home'))
 
@@ -691,13 +824,9 @@ def get_user_tokens():
     if not user:
         return jsonify({"error": "User not found"}), 404
     
-    # Check and reset tokens if needed (just in case they haven't visited dashboard)
-    check_and_reset_tokens(user)
-    
+    # Monthly reset is derived from tokens_reset_at; this endpoint never writes
     return jsonify({
-        "free_tokens": user.free_tokens,
-        "paid_tokens": user.paid_tokens,
-        "total_tokens": user.free_tokens + user.paid_tokens,
+        **get_effective_balance(user),
         "max_free": 4000
     })
 
@@ -726,27 +855,16 @@ def fetch_media():
         # Silently redirect back; UI should already hide this on unsupported plans
         return redirect(url_for('dashboard'))
 
-    user_id = user.id
+    if not user.ig_access_token:
+        return redirect(url_for('dashboard'))
 
-    # Simulated content for the selection grid
-    mock_media = [
-        {"id": "media_1", "thumb": "https://images.unsplash.com/photo-1498050108023-c5249f4df085?w=300&h=300&fit=crop", "cap": "Reel 01: Coding Flow"},
-        {"id": "media_2", "thumb": "https://images.unsplash.com/photo-1461749280684-dccba630e2f6?w=300&h=300&fit=crop", "cap": "Post 02: Agency Secret"},
-        {"id": "media_3", "thumb": "https://images.unsplash.com/photo-1555066931-4365d14bab8c?w=300&h=300&fit=crop", "cap": "Reel 03: Growth Hacks"}
-    ]
-    
-    for m in mock_media:
-        if not AutomatedMedia.query.filter_by(user_id=user_id, media_id=m['id']).first():
-            new_media = AutomatedMedia(
-                user_id=user_id,
-                media_id=m['id'],
-                thumbnail_url=m['thumb'],
-                caption=m['cap'],
-                is_active=False
-            )
-            db.session.add(new_media)
-    
-    db.session.commit()
+    try:
+        result = import_user_media(user, full=request.values.get('full') == '1')
+    except MediaImportError as e:
+        print(f"Media import failed for {user.username}: {str(e)}")
+        return redirect(url_for('dashboard'))
+
+    log_activity(user.id, "Imported media", f"{result['added']} new, {result['updated']} updated")
     return redirect(url_for('dashboard'))
 
 @app.route('/dashboard/media/toggle/<int:mid>', methods=['POST'])
@@ -800,28 +918,52 @@ def get_activity():
     ]
     return jsonify(random.sample(events, 3))
 
+EXPORT_BATCH_SIZE = 1000
+
+
+def iter_lead_csv(query, batch_size=EXPORT_BATCH_SIZE):
+    """Yield a lead CSV in chunks, reading rows from the database in server-side batches."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['Handle', 'Status', 'Niche Relevance', 'Captured At'])
+
+    for i, lead in enumerate(query.yield_per(batch_size), start=1):
+        writer.writerow([lead.handle, lead.status, lead.niche_relevance, lead.timestamp])
+        if i % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+def gzip_stream(chunks):
+    """Incrementally gzip an iterable of text chunks."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
 @app.route('/dashboard/export')
 def export_leads():
     if 'user_id' not in session:
         return redirect(url_for('login_ui'))
     
-    import csv
-    import io
-    from flask import make_response
+    query = build_lead_query(session['user_id'], request.args).order_by(Lead.timestamp.desc(), Lead.id.desc())
+    body = iter_lead_csv(query)
     
-    user_id = session['user_id']
-    leads = Lead.query.filter_by(user_id=user_id).all()
-    
-    si = io.StringIO()
-    cw = csv.writer(si)
-    cw.writerow(['Handle', 'Status', 'Niche Relevance', 'Captured At'])
-    for lead in leads:
-        cw.writerow([lead.handle, lead.status, lead.niche_relevance, lead.timestamp])
+    headers = {
+        "Content-Disposition": "attachment; filename=zenflow_leads.csv",
+        "Vary": "Accept-Encoding"
+    }
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        body = gzip_stream(body)
+        headers["Content-Encoding"] = "gzip"
     
-    output = make_response(si.getvalue())
-    output.headers["Content-Disposition"] = "attachment; filename=zenflow_leads.csv"
-    output.headers["Content-type"] = "text/csv"
-    return output
+    return Response(stream_with_context(body), mimetype="text/csv", headers=headers)
 
 @app.route('/beta-foundation-signup', methods=['POST'])
 def beta_foundation_signup():
@@ -830,36 +972,38 @@ def beta_foundation_signup():
     handle = request.form.get('instagram_handle', '').strip().lstrip('@')
     plan = request.form.get('plan', 'Foundation').strip() or 'Foundation'
 
-    # Per-plan limits
-    if plan == 'Growth Engine':
-        limit = 25
-    else:
-        limit = 49  # Foundation default
-
-    if BetaSignup.query.filter_by(plan=plan).count() >= limit:
-        return redirect(url_for('beta_foundation_page', full='1', plan=('growth' if plan == 'Growth Engine' else 'foundation')))
+    if plan not in BETA_PLAN_LIMITS:
+        plan = 'Foundation'
+    page_plan = 'growth' if plan == 'Growth Engine' else 'foundation'
 
     if not name or not email or not handle:
-        return redirect(url_for('beta_foundation_page', plan=('growth' if plan == 'Growth Engine' else 'foundation')))
+        return redirect(url_for('beta_foundation_page', plan=page_plan))
+
+    # Claiming the slot and inserting the signup commit together, so concurrent
+    # signups can never take a plan past its limit
+    if not try_claim(beta_counter(plan), BETA_PLAN_LIMITS[plan]):
+        db.session.rollback()
+        return redirect(url_for('beta_foundation_page', full='1', plan=page_plan))
 
     signup = BetaSignup(name=name, email=email, instagram_handle=handle, plan=plan)
     db.session.add(signup)
     db.session.commit()
+    page_cache.invalidate('/beta-foundation')
 
     return redirect(url_for('beta_foundation_page', success='1'))
 
 @app.route('/beta-foundation')
+@cached_public_page
 def beta_foundation_page():
     # Determine which plan's beta page to show
     raw_plan = request.args.get('plan', 'foundation').lower()
     if raw_plan == 'growth':
         plan_label = 'Growth Engine'
-        limit = 25
     else:
         plan_label = 'Foundation'
-        limit = 49
+    limit = BETA_PLAN_LIMITS[plan_label]
 
-    total_signups = BetaSignup.query.filter_by(plan=plan_label).count()
+    total_signups = get_counter(beta_counter(plan_label))
     remaining = max(limit - total_signups, 0)
     is_full = total_signups >= limit
 
@@ -892,128 +1036,92 @@ def handle_new_mention(mention_data):
     pass
 
 
-def check_new_instagram_activity():
-    """Check for new Instagram activity (comments, mentions) periodically"""
-    # Get all users with connected Instagram accounts
-    connected_users = User.query.filter(
-        (User.ig_access_token.isnot(None)) | (User.ig_username.isnot(None))
-    ).all()
-    
-    for user in connected_users:
-        # Check if using OAuth (token-based) or direct authentication (username/password)
-        if user.ig_access_token:
-            # OAuth method
-            if user.token_expires_at and user.token_expires_at < datetime.utcnow():
-                # Try to refresh the token
-                if not refresh_long_lived_token(user):
-                    print(f"Could not refresh token for user {user.username}")
-                    continue
+def list_connected_user_ids(shard_index=0, shard_count=1):
+    """Ids of users with a connected Instagram account and at least one active automated media, in this poller shard"""
+    has_active_media = db.session.query(AutomatedMedia.id).filter(
+        AutomatedMedia.user_id == User.id,
+        AutomatedMedia.is_active.is_(True)
+    ).exists()
+    query = db.session.query(User.id).filter(
+        (User.ig_access_token.isnot(None)) | (User.ig_username.isnot(None)),
+        has_active_media
+    )
+    if shard_count > 1:
+        query = query.filter(User.id % shard_count == shard_index)
+    return [user_id for (user_id,) in query.all()]
+
+
+def check_user_instagram_activity(user):
+    """Check one user's Instagram account for new activity (comments, mentions)"""
+    # Check if using OAuth (token-based) or direct authentication (username/password)
+    if user.ig_access_token:
+        # OAuth method
+        if user.token_expires_at and user.token_expires_at < datetime.utcnow():
+            # Try to refresh the token
+            if not refresh_long_lived_token(user):
+                print(f"Could not refresh token for user {user.username}")
+                return
+        
+        try:
+            instagram_api = InstagramAPI(user.ig_access_token)
+            recent_mentions, errors = get_recent_mentions(user)
+            for error in errors:
+                print(f"Partial poll failure for user {user.username} on media {error['media_id']}: {error['error']}")
             
-            try:
-                instagram_api = InstagramAPI(user.ig_access_token)
-                recent_mentions = get_recent_mentions(user)
-                
-                # Process each mention/comment
-                for mention in recent_mentions:
-                    # Check if this is a wake word that should trigger automation
-                    wake_word = mention.get('text', '').upper()
+            # Process the mentions/comments as one batch; already-answered comments are skipped
+            matched, unanswered = process_comment_batch(user, recent_mentions)
+            advance_comment_cursors(user.id, recent_mentions, unanswered)
                     
-                    # Get user's funnel to see if there are any matching wake words
-                    funnel = Funnel.query.filter_by(user_id=user.id).first()
-                    if funnel and funnel.active and funnel.wakeword in wake_word:
-                        # Trigger automated response
-                        handle_automation_trigger(user, mention)
-                        
-            except Exception as e:
-                print(f"Error checking Instagram activity for user {user.username} (OAuth): {str(e)}")
-        elif user.ig_username and user.ig_password_encrypted:
-            # Direct authentication method
-            try:
-                from instagram_api import direct_api_call
-                from cryptography.fernet import Fernet
-                import base64
-                import hashlib
-                
-                # Decrypt password
-                key = hashlib.sha256(os.getenv('ENCRYPTION_KEY', 'your-secret-key-for-encryption-change-this-in-production').encode()).digest()
-                encoded_key = base64.urlsafe_b64encode(key)
-                f = Fernet(encoded_key)
-                decrypted_password = f.decrypt(user.ig_password_encrypted.encode()).decode()
-                
-                # Use direct API to check for activity
-                client = direct_api_call(user.ig_username, decrypted_password, None)
-                if client:
-                    # Process activity using direct API
-                    # This would involve getting recent comments, etc. using instagrapi
-                    # For now, we'll log that we're using direct auth
-                    print(f"Checking activity for {user.username} using direct authentication")
-                    
-            except Exception as e:
-                print(f"Error checking Instagram activity for user {user.username} (Direct Auth): {str(e)}")
-
-
-def handle_automation_trigger(user, mention_data):
-    """Handle automation trigger when wake word is detected"""
-    # Check for tokens
-    if user.free_tokens > 0:
-        token_source = "free_tokens"
-    elif user.paid_tokens > 0:
-        token_source = "paid_tokens"
-    else:
-        print(f"User {user.username} has 0 tokens remaining. Automation skipped.")
-        return
-
-    # Get user's funnel
-    funnel = Funnel.query.filter_by(user_id=user.id).first()
-    if not funnel or not funnel.active:
-        return
-    
-    # Create an automated response
-    try:
-        instagram_api = InstagramAPI(user.ig_access_token)
-        
-        # Format the response script with the link
-        response_script = funnel.script.format(link=funnel.link)
-        
-        # Post a comment in response to the mention
-        result = instagram_api.post_comment(mention_data['media_id'], response_script)
-        
-        if result:
-            # Deduct token
-            if token_source == "free_tokens":
-                user.free_tokens -= 1
-            else:
-                user.paid_tokens -= 1
+        except Exception as e:
+            print(f"Error checking Instagram activity for user {user.username} (OAuth): {str(e)}")
+    elif user.ig_username and user.ig_password_encrypted:
+        # Direct authentication method
+        try:
+            from instagram_api import direct_api_call
             
-            db.session.commit()
-            print(f"Posted automated response to {mention_data['username']}'s comment. Used 1 {token_source}.")
-        else:
-            print(f"Failed to post response to {mention_data['username']}'s comment")
+            # Decrypt password
+            decrypted_password = decrypt_password(user.ig_password_encrypted)
             
-    except Exception as e:
-        print(f"Error posting automated response: {str(e)}")
+            # Use direct API to check for activity
+            client = direct_api_call(user.ig_username, decrypted_password, None)
+            if client:
+                # Process activity using direct API
+                # This would involve getting recent comments, etc. using instagrapi
+                # For now, we'll log that we're using direct auth
+                print(f"Checking activity for {user.username} using direct authentication")
+                
+        except Exception as e:
+            print(f"Error checking Instagram activity for user {user.username} (Direct Auth): {str(e)}")
+
 
 def refresh_instagram_token(user):
     """Refresh Instagram long-lived token if expired"""
     return refresh_long_lived_token(user)
 
 
-# Import threading for background tasks
-import threading
-import time
+def poll_user_activity(user_id):
+    """Scheduler job: poll a single account inside its own app context"""
+    with app.app_context():
+        user = User.query.get(user_id)
+        if user:
+            check_user_instagram_activity(user)
 
 
-def run_periodic_tasks():
-    """Run periodic tasks in the background"""
-    while True:
-        try:
-            with app.app_context():
-                check_new_instagram_activity()
-        except Exception as e:
-            print(f"Error in periodic tasks: {str(e)}")
-        
-        # Wait 5 minutes before next check
-        time.sleep(300)
+def list_poll_accounts(shard_index, shard_count):
+    with app.app_context():
+        return list_connected_user_ids(shard_index, shard_count)
+
+
+poll_scheduler = PollScheduler(list_poll_accounts, poll_user_activity)
+
+
+def verify_webhook_signature(body, signature):
+    """Check Meta's X-Hub-Signature-256 header: an HMAC-SHA256 of the raw body keyed with the app secret"""
+    app_secret = os.getenv('FB_APP_SECRET')
+    if not app_secret or not signature or not signature.startswith('sha256='):
+        return False
+    expected = hmac.new(app_secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature[len('sha256='):])
 
 
 @app.route('/webhook/instagram', methods=['GET', 'POST'])
@@ -1029,25 +1137,36 @@ def instagram_webhook():
         else:
             return 'Verification token mismatch', 403
     
-    # Process webhook payload
+    # Queue webhook payload; consumers process it off the request thread
     elif request.method == 'POST':
+        if not verify_webhook_signature(request.get_data(), request.headers.get('X-Hub-Signature-256')):
+            print("Rejected webhook with a missing or invalid signature")
+            return {'success': False, 'error': 'Invalid signature'}, 403
+        
+        if request.get_json(silent=True) is None:
+            return {'success': False, 'error': 'Invalid JSON payload'}, 400
+        
         try:
-            data = request.json
-            print(f"Webhook received: {json.dumps(data, indent=2)}")
-            
-            # Process webhook using the InstagramAPI module
-            from instagram_api import process_webhook_payload
-            process_webhook_payload(data)
-            
+            webhook_queue.enqueue(request.get_data(as_text=True))
             return {'success': True}, 200
         except Exception as e:
-            print(f"Error processing webhook: {str(e)}")
+            print(f"Error queueing webhook: {str(e)}")
             return {'success': False, 'error': str(e)}, 500
 
 
+def handle_queued_webhook(payload):
+    """Webhook consumer job: process one queued payload inside an app context"""
+    with app.app_context():
+        process_webhook_payload(json.loads(payload))
+
+
+webhook_queue = WebhookQueue(os.getenv('WEBHOOK_QUEUE_PATH', os.path.join(app.instance_path, 'webhook_queue.db')))
+webhook_consumer = WebhookConsumer(webhook_queue, handle_queued_webhook)
+
+
 if __name__ == '__main__':
-    # Start periodic tasks in a background thread
-    periodic_thread = threading.Thread(target=run_periodic_tasks, daemon=True)
-    periodic_thread.start()
+    # Start polling connected accounts and draining webhooks in the background
+    poll_scheduler.start()
+    webhook_consumer.start()
     
     app.run(debug=True, port=5000)
\ No newline at end of file
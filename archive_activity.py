@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Activity log retention job
+Moves activity_log rows older than the retention window into gzip-compressed
+JSONL archive files and deletes them from the hot table. Run it from cron, e.g. daily:
+
+    0 3 * * * cd /path/to/app && python archive_activity.py
+"""
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+
+from models import db, ActivityLog
+
+ACTIVITY_RETENTION_DAYS = int(os.getenv('ACTIVITY_RETENTION_DAYS', '90'))
+ACTIVITY_ARCHIVE_DIR = os.getenv('ACTIVITY_ARCHIVE_DIR', os.path.join('instance', 'activity_archive'))
+ARCHIVE_BATCH_SIZE = 1000
+
+
+def archive_activity_logs(retention_days=ACTIVITY_RETENTION_DAYS, archive_dir=ACTIVITY_ARCHIVE_DIR,
+                          batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Archive and prune rows older than `retention_days`; returns (archived count, archive path).
+
+    Rows are copied in id order, one batch at a time. Each batch is written and
+    flushed to the archive before it is deleted, so a crash can at worst leave
+    rows that are both archived and still in the table, never lost ones.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"activity_log-{datetime.utcnow().strftime('%Y%m%d-%H%M%S-%f')}.jsonl.gz")
+
+    archived = 0
+    last_id = 0
+    with open(path, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb') as archive:
+        while True:
+            rows = ActivityLog.query.filter(
+                ActivityLog.timestamp < cutoff,
+                ActivityLog.id > last_id
+            ).order_by(ActivityLog.id).limit(batch_size).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            for row in rows:
+                archive.write((json.dumps({
+                    "id": row.id,
+                    "user_id": row.user_id,
+                    "action": row.action,
+                    "details": row.details,
+                    "timestamp": row.timestamp.isoformat() if row.timestamp else None,
+                }) + "\n").encode())
+            archive.flush()
+            raw.flush()
+            os.fsync(raw.fileno())
+
+            ActivityLog.query.filter(ActivityLog.id.in_([row.id for row in rows])).delete(synchronize_session=False)
+            db.session.commit()
+            archived += len(rows)
+
+    if not archived:
+        os.remove(path)
+        path = None
+    return archived, path
+
+
+def main():
+    from app import app
+
+    with app.app_context():
+        archived, path = archive_activity_logs()
+    if archived:
+        print(f"Archived {archived} activity log row(s) to {path}.")
+    else:
+        print(f"No activity older than {ACTIVITY_RETENTION_DAYS} days.")
+
+
+if __name__ == "__main__":
+    main()
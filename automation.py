@@ -0,0 +1,338 @@
+"""
+Automation Module
+Wakeword matching, comment de-duplication and automated replies, shared by
+the webhook consumers and the account poller
+"""
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Funnel, ProcessedComment
+from instagram_api import InstagramAPI
+from token_ledger import debit_token, credit_tokens, reserve_tokens
+
+
+# Seconds a cached matcher is trusted before it is rebuilt, so funnel edits
+# made in another process are picked up even without an explicit invalidation
+MATCHER_CACHE_TTL = float(os.getenv('MATCHER_CACHE_TTL', '60'))
+
+FunnelRule = namedtuple('FunnelRule', ['id', 'wakeword', 'script', 'link', 'active'])
+
+
+def parse_wakewords(raw):
+    """Split a comma-separated wakeword field into unique, upper-cased keywords"""
+    words = []
+    for word in (raw or '').split(','):
+        word = word.strip().upper()
+        if word and word not in words:
+            words.append(word)
+    return words
+
+
+class WakewordMatcher:
+    """
+    All of a user's active funnel wakewords compiled into one regex.
+
+    Longer keywords are tried first so the most specific funnel wins, and a
+    comment is matched in a single pass without touching the database.
+    """
+
+    def __init__(self, funnels):
+        self._rules = {}
+        for funnel in funnels:
+            if not funnel.active:
+                continue
+            rule = FunnelRule(funnel.id, funnel.wakeword, funnel.script, funnel.link, True)
+            for word in parse_wakewords(funnel.wakeword):
+                self._rules.setdefault(word, rule)
+
+        self._pattern = None
+        if self._rules:
+            alternatives = sorted(self._rules, key=len, reverse=True)
+            self._pattern = re.compile('|'.join(re.escape(word) for word in alternatives))
+
+    def match(self, text):
+        """Return the FunnelRule whose wakeword appears in the text, or None"""
+        if not self._pattern or not text:
+            return None
+        found = self._pattern.search(text.upper())
+        return self._rules[found.group(0)] if found else None
+
+
+_matcher_cache = {}
+_matcher_lock = threading.Lock()
+
+
+def get_wakeword_matcher(user_id):
+    """Return the cached matcher for a user, building it from their funnels when missing or stale"""
+    now = time.monotonic()
+    with _matcher_lock:
+        cached = _matcher_cache.get(user_id)
+        if cached and now - cached[0] < MATCHER_CACHE_TTL:
+            return cached[1]
+
+    matcher = WakewordMatcher(Funnel.query.filter_by(user_id=user_id).all())
+    with _matcher_lock:
+        _matcher_cache[user_id] = (now, matcher)
+    return matcher
+
+
+def invalidate_wakeword_matcher(user_id):
+    """Drop a user's cached matcher after their funnels change"""
+    with _matcher_lock:
+        _matcher_cache.pop(user_id, None)
+
+
+def claim_comment(user_id, mention_data):
+    """
+    Record a comment as processed. Returns False if it was already claimed.
+
+    The primary key on comment_id makes the claim atomic across webhook
+    consumers and poller processes, so a comment triggers at most once.
+    """
+    db.session.add(ProcessedComment(
+        comment_id=mention_data['comment_id'],
+        user_id=user_id,
+        media_id=mention_data.get('media_id'),
+        processed_at=datetime.utcnow()
+    ))
+    try:
+        db.session.commit()
+        return True
+    except IntegrityError:
+        db.session.rollback()
+        return False
+
+
+def claim_comments(user_id, mentions, attempts=3):
+    """
+    Claim several comments at once; returns the set of comment ids claimed here.
+
+    Existing claims are found with one IN query and the new ones are written
+    with one bulk INSERT. Nothing is committed, so the caller can commit the
+    claims together with its token reservation, so call it with no other
+    pending changes. If a webhook consumer claims one of the comments in
+    between, the INSERT hits the primary key and the diff is simply redone.
+    """
+    candidates = {}
+    for mention_data in mentions:
+        candidates.setdefault(mention_data['comment_id'], mention_data)
+    if not candidates:
+        return set()
+
+    for attempt in range(attempts):
+        taken = {
+            comment_id for (comment_id,) in db.session.query(ProcessedComment.comment_id).filter(
+                ProcessedComment.comment_id.in_(list(candidates))
+            )
+        }
+        now = datetime.utcnow()
+        rows = [
+            {"comment_id": comment_id, "user_id": user_id,
+             "media_id": mention_data.get('media_id'), "processed_at": now}
+            for comment_id, mention_data in candidates.items() if comment_id not in taken
+        ]
+        if not rows:
+            return set()
+        try:
+            db.session.execute(db.insert(ProcessedComment), rows)
+            return {row["comment_id"] for row in rows}
+        except IntegrityError:
+            db.session.rollback()
+            if attempt == attempts - 1:
+                raise
+    return set()
+
+
+def release_comments(comment_ids):
+    """
+    Drop the claims of comments that got no reply (no tokens left, or the
+    post failed) so a later poll or webhook delivery can answer them. Commits.
+    """
+    comment_ids = [comment_id for comment_id in comment_ids if comment_id]
+    if not comment_ids:
+        return
+    ProcessedComment.query.filter(ProcessedComment.comment_id.in_(comment_ids)).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def is_own_comment(user, mention_data, account_id=None):
+    """True for comments written by the connected account itself, e.g. its own automated replies"""
+    from_id = mention_data.get('from_id')
+    if from_id and from_id in (account_id, user.ig_user_id):
+        return True
+    username = mention_data.get('username')
+    return bool(username and user.ig_username) and username.lower() == user.ig_username.lower()
+
+
+def match_and_claim(user, mention_data):
+    """Return the funnel a new comment should trigger, or None if it doesn't match or was already handled"""
+    funnel = get_wakeword_matcher(user.id).match(mention_data.get('text'))
+    if not funnel:
+        return None
+
+    if not mention_data.get('comment_id') or not claim_comment(user.id, mention_data):
+        return None
+
+    return funnel
+
+
+def process_comment_event(user, mention_data):
+    """Trigger the user's funnel for a new comment, once per comment id"""
+    funnel = match_and_claim(user, mention_data)
+    if not funnel:
+        return False
+
+    handle_automation_trigger(user, mention_data, funnel)
+    return True
+
+
+def process_comment_batch(user, mentions):
+    """
+    Trigger automations for a batch of comments from one poll.
+
+    Matching comments are claimed in bulk and committed in one transaction
+    together with the tokens reserved for them, the reservation is reconciled
+    once at the end, and the replies themselves go out as Graph batch requests
+    (up to 50 per call).
+    Returns (matched, unanswered): the number of comments that matched a
+    funnel, and the matched comments that definitely got no reply and were
+    released for a retry (see release_comments). A reply whose outcome is
+    unknown keeps its claim and its token, so it is never posted twice.
+    """
+    matcher = get_wakeword_matcher(user.id)
+    matches = []
+    for mention_data in mentions:
+        # The account's own replies are comments too; answering them would loop
+        if not mention_data.get('comment_id') or is_own_comment(user, mention_data):
+            continue
+        funnel = matcher.match(mention_data.get('text'))
+        if funnel:
+            matches.append((mention_data, funnel))
+
+    try:
+        claimed = claim_comments(user.id, [mention_data for mention_data, funnel in matches])
+    except Exception:
+        db.session.rollback()
+        raise
+    triggers = []
+    for mention_data, funnel in matches:
+        # A comment id repeated within the batch is only triggered once
+        if mention_data['comment_id'] in claimed:
+            claimed.discard(mention_data['comment_id'])
+            triggers.append((mention_data, funnel))
+
+    if not triggers:
+        db.session.rollback()
+        return 0, []
+
+    # Commits the claims and the reservation together
+    reservation = reserve_tokens(user.id, len(triggers))
+    queued = []
+    unanswered = []
+    try:
+        with InstagramAPI(user.ig_access_token).batch() as batch:
+            for mention_data, funnel in triggers:
+                if not funnel.active:
+                    continue
+                token_source = spend_token(user, mention_data, reservation)
+                if not token_source:
+                    unanswered.append(mention_data)
+                    continue
+                try:
+                    request = batch.post(f"{mention_data['media_id']}/comments", message=format_reply(funnel))
+                except Exception as e:
+                    print(f"Error queueing automated response: {str(e)}")
+                    settle_reply(user, mention_data, token_source, False, True, reservation)
+                    unanswered.append(mention_data)
+                    continue
+                queued.append((mention_data, token_source, request))
+
+        for mention_data, token_source, request in queued:
+            if request.error:
+                print(f"Batched reply to comment {mention_data.get('comment_id')} failed: {request.error}")
+            if not settle_reply(user, mention_data, token_source, request.ok, request.rejected, reservation):
+                unanswered.append(mention_data)
+    finally:
+        reservation.reconcile()
+        release_comments([mention_data.get('comment_id') for mention_data in unanswered])
+    return len(triggers), unanswered
+
+
+def format_reply(funnel):
+    """The funnel's reply script with its link filled in"""
+    return funnel.script.format(link=funnel.link)
+
+
+def spend_token(user, mention_data, reservation=None):
+    """Spend one token before replying so concurrent workers can't double-spend; returns its source or None"""
+    reference = mention_data.get('comment_id')
+    if reservation is not None:
+        token_source = reservation.consume(reference)
+    else:
+        token_source = debit_token(user.id, reference=reference)
+    if not token_source:
+        print(f"User {user.username} has 0 tokens remaining. Automation skipped.")
+    return token_source
+
+
+def settle_reply(user, mention_data, token_source, posted, rejected, reservation=None):
+    """
+    Log a reply's outcome and refund its token if Graph rejected it.
+
+    A POST that timed out or lost its connection may already have been
+    posted, so unless Graph answered with an error (`rejected`) the token
+    stays spent. Returns False only when the reply was refunded, i.e. the
+    comment should be released for a retry.
+    """
+    if posted:
+        print(f"Posted automated response to {mention_data['username']}'s comment. Used 1 {token_source}.")
+        return True
+
+    if not rejected:
+        print(f"Response to {mention_data['username']}'s comment may have been posted; keeping its token and claim")
+        return True
+
+    print(f"Failed to post response to {mention_data['username']}'s comment")
+    # Refund the token that was spent on the failed reply
+    reference = mention_data.get('comment_id')
+    if reservation is not None:
+        reservation.release(token_source, reference)
+    else:
+        credit_tokens(user.id, token_source, 1, "automation_refund", reference)
+    return False
+
+
+def handle_automation_trigger(user, mention_data, funnel=None, reservation=None):
+    """Handle automation trigger when wake word is detected"""
+    # Use the funnel that matched, or fall back to the user's first funnel
+    if funnel is None:
+        funnel = Funnel.query.filter_by(user_id=user.id).first()
+    if not funnel or not funnel.active:
+        return
+    
+    token_source = spend_token(user, mention_data, reservation)
+    if not token_source:
+        # Leave the comment answerable once the user has tokens again
+        release_comments([mention_data.get('comment_id')])
+        return
+    
+    # Create an automated response
+    rejected = False
+    try:
+        instagram_api = InstagramAPI(user.ig_access_token)
+        
+        # Post a comment in response to the mention
+        result = instagram_api.post_comment(mention_data['media_id'], format_reply(funnel))
+        rejected = result is None and instagram_api.last_error_rejected
+    except Exception as e:
+        print(f"Error posting automated response: {str(e)}")
+        result = None
+    
+    if not settle_reply(user, mention_data, token_source, bool(result), rejected, reservation):
+        release_comments([mention_data.get('comment_id')])
@@ -0,0 +1,118 @@
+"""
+Capacity Counters Module
+Claimable slot counters for the beta plans, plus the FOUNDING50 coupon usage.
+Claims are a single conditional UPDATE, and reads go through a short in-process
+cache so the public pages never COUNT(*) on every hit.
+"""
+import os
+import threading
+import time
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, User, BetaSignup, CapacityCounter
+
+COUNTER_CACHE_TTL = float(os.getenv('COUNTER_CACHE_TTL', '10'))
+
+BETA_PLAN_LIMITS = {
+    'Foundation': 49,
+    'Growth Engine': 25,
+}
+
+
+def beta_counter(plan):
+    return f'beta_signup:{plan}'
+
+
+def count_source_rows(name):
+    """The authoritative COUNT(*) behind a counter; only used to seed or resync it"""
+    if name.startswith('beta_signup:'):
+        return BetaSignup.query.filter_by(plan=name.split(':', 1)[1]).count()
+    raise ValueError(f"Unknown counter: {name}")
+
+
+_counter_cache = {}
+_counter_lock = threading.Lock()
+
+
+def invalidate_counter(name):
+    with _counter_lock:
+        _counter_cache.pop(name, None)
+
+
+def _cached(name, load):
+    now = time.monotonic()
+    with _counter_lock:
+        cached = _counter_cache.get(name)
+        if cached and now - cached[0] < COUNTER_CACHE_TTL:
+            return cached[1]
+
+    value = load()
+    with _counter_lock:
+        _counter_cache[name] = (now, value)
+    return value
+
+
+def ensure_counter(name):
+    """Create the counter row, seeded from the source table, if missing; returns True if it was created"""
+    if db.session.query(CapacityCounter.used).filter_by(name=name).scalar() is not None:
+        return False
+    used = count_source_rows(name)
+    try:
+        with db.session.begin_nested():
+            db.session.add(CapacityCounter(name=name, used=used))
+    except IntegrityError:
+        return False  # Another request seeded it first
+    return True
+
+
+def get_counter(name):
+    """Slots used so far; may lag a claim made in another process by up to COUNTER_CACHE_TTL"""
+    def load():
+        if ensure_counter(name):
+            db.session.commit()
+        return db.session.query(CapacityCounter.used).filter_by(name=name).scalar()
+    return _cached(name, load)
+
+
+def get_founding_coupon_usage():
+    """
+    Users holding the founding coupon, as a COUNT(*) cached for COUNTER_CACHE_TTL.
+
+    The flag is set outside this app, so there is no claim to keep a counter
+    row in step; the count is re-read instead of being seeded once.
+    """
+    return _cached('founding_coupon', lambda: User.query.filter_by(used_founding_coupon=True).count())
+
+
+def try_claim(name, limit):
+    """
+    Take one slot if fewer than `limit` are used; returns True on success.
+
+    The check and the increment are one UPDATE ... WHERE used < limit, so
+    concurrent claims can never push a counter past its limit. The claim is
+    part of the caller's transaction: commit it together with the row it pays
+    for, or roll back to give the slot back.
+    """
+    ensure_counter(name)
+    claimed = db.session.execute(
+        db.update(CapacityCounter)
+        .where(CapacityCounter.name == name, CapacityCounter.used < limit)
+        .values(used=CapacityCounter.used + 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount == 1
+    invalidate_counter(name)
+    return claimed
+
+
+def resync_counter(name):
+    """Reset a counter to its source COUNT(*), e.g. after rows were deleted by hand"""
+    ensure_counter(name)
+    db.session.execute(
+        db.update(CapacityCounter)
+        .where(CapacityCounter.name == name)
+        .values(used=count_source_rows(name))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    invalidate_counter(name)
@@ -0,0 +1,95 @@
+"""
+Comment Cursors Module
+Per-media high-water mark (newest comment timestamp and id) so each poll only
+asks the Graph API for comments it has not seen yet
+"""
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, CommentCursor
+from instagram_api import parse_graph_timestamp
+
+# Keeps IN (...) lists under SQLite's bound-parameter limit
+CURSOR_CHUNK = 500
+
+
+def load_comment_cursors(user_id, media_ids):
+    """Map media id -> (last_comment_at, last_comment_id) for the given media"""
+    media_ids = list(media_ids)
+    cursors = {}
+    for i in range(0, len(media_ids), CURSOR_CHUNK):
+        rows = db.session.query(
+            CommentCursor.media_id, CommentCursor.last_comment_at, CommentCursor.last_comment_id
+        ).filter(
+            CommentCursor.user_id == user_id,
+            CommentCursor.media_id.in_(media_ids[i:i + CURSOR_CHUNK])
+        ).all()
+        cursors.update((media_id, (last_at, last_id)) for media_id, last_at, last_id in rows)
+    return cursors
+
+
+def newest_per_media(mentions):
+    """The newest (timestamp, comment_id) in `mentions` for each media id"""
+    newest = {}
+    for mention in mentions:
+        created_at = parse_graph_timestamp(mention.get('timestamp'))
+        if created_at is None:
+            continue
+        current = newest.get(mention['media_id'])
+        if current is None or created_at > current[0]:
+            newest[mention['media_id']] = (created_at, mention['comment_id'])
+    return newest
+
+
+def advance_comment_cursors(user_id, mentions, unanswered=()):
+    """
+    Move each media's cursor up to the newest comment in `mentions` and commit.
+
+    Call only after the mentions were processed: a poll that fails before this
+    point leaves the cursors where they were, so the same comments are fetched
+    again (ProcessedComment still keeps replies from being sent twice).
+    On a media with `unanswered` comments the cursor stops short of the oldest
+    of them, so the next poll fetches them again. Cursors never move backwards.
+    """
+    # media id -> timestamp of its oldest comment that still needs a reply
+    hold = {}
+    for mention in unanswered:
+        created_at = parse_graph_timestamp(mention.get('timestamp'))
+        if created_at is not None and (mention['media_id'] not in hold or created_at < hold[mention['media_id']]):
+            hold[mention['media_id']] = created_at
+
+    def below_hold(mention):
+        held_at = hold.get(mention['media_id'])
+        if held_at is None:
+            return True
+        created_at = parse_graph_timestamp(mention.get('timestamp'))
+        return created_at is not None and created_at < held_at
+
+    newest = newest_per_media([mention for mention in mentions if below_hold(mention)])
+    if not newest:
+        return 0
+
+    existing = load_comment_cursors(user_id, newest)
+    now = datetime.utcnow()
+    new_rows = []
+    changed_rows = []
+    for media_id, (created_at, comment_id) in newest.items():
+        row = {"user_id": user_id, "media_id": media_id, "last_comment_at": created_at,
+               "last_comment_id": comment_id, "updated_at": now}
+        if media_id not in existing:
+            new_rows.append(row)
+        elif created_at > existing[media_id][0]:
+            changed_rows.append(row)
+
+    try:
+        if new_rows:
+            db.session.execute(db.insert(CommentCursor), new_rows)
+        if changed_rows:
+            db.session.execute(db.update(CommentCursor), changed_rows)
+        db.session.commit()
+    except IntegrityError:
+        # Another worker created the cursor first; the next poll catches up from it
+        db.session.rollback()
+        return 0
+    return len(new_rows) + len(changed_rows)
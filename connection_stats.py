@@ -0,0 +1,87 @@
+"""
+Instagram Connection Statistics Module
+Aggregate totals for the admin connections page, and per-day revenue/token
+rollups kept in a small summary table as connection stats are updated
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, InstagramConnection, InstagramConnectionDailyStats
+
+ROLLUP_DAYS = 14
+
+
+def get_connection_totals():
+    """Connection count, revenue, tokens used and active count in one aggregate query"""
+    total, revenue, tokens_used, active = db.session.query(
+        db.func.count(InstagramConnection.id),
+        db.func.coalesce(db.func.sum(InstagramConnection.revenue), 0.0),
+        db.func.coalesce(db.func.sum(InstagramConnection.tokens_used), 0),
+        db.func.coalesce(db.func.sum(db.case((InstagramConnection.is_active.is_(True), 1), else_=0)), 0),
+    ).one()
+    return {
+        "total_connections": total,
+        "total_revenue": float(revenue),
+        "total_tokens_used": int(tokens_used),
+        "active_connections": int(active),
+    }
+
+
+def record_connection_usage(revenue_delta=0.0, tokens_delta=0, day=None):
+    """
+    Add revenue/token deltas to the rollup row for `day` (default: today, UTC).
+
+    The increment is a single UPDATE ... SET x = x + delta, so concurrent
+    updates never overwrite each other. The first update of a day inserts the
+    row inside a savepoint; if another request inserted it first, the UPDATE is
+    simply retried. Runs in the caller's transaction, so the rollup commits
+    together with the connection change.
+    """
+    if not revenue_delta and not tokens_delta:
+        return
+    day = day or datetime.utcnow().date()
+
+    def increment():
+        return db.session.execute(
+            db.update(InstagramConnectionDailyStats)
+            .where(InstagramConnectionDailyStats.day == day)
+            .values(
+                revenue=InstagramConnectionDailyStats.revenue + revenue_delta,
+                tokens_used=InstagramConnectionDailyStats.tokens_used + tokens_delta,
+            )
+            .execution_options(synchronize_session=False)
+        ).rowcount
+
+    if increment():
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(InstagramConnectionDailyStats(
+                day=day,
+                revenue=revenue_delta,
+                tokens_used=tokens_delta,
+            ))
+    except IntegrityError:
+        increment()
+
+
+def get_daily_rollups(days=ROLLUP_DAYS):
+    """Rollup rows for the last `days` days, newest first, with empty days filled with zeros"""
+    today = datetime.utcnow().date()
+    since = today - timedelta(days=days - 1)
+    rows = InstagramConnectionDailyStats.query.filter(
+        InstagramConnectionDailyStats.day >= since
+    ).all()
+    by_day = {row.day: row for row in rows}
+
+    rollups = []
+    for i in range(days):
+        day = today - timedelta(days=i)
+        row = by_day.get(day)
+        rollups.append({
+            "day": day,
+            "revenue": row.revenue if row else 0.0,
+            "tokens_used": row.tokens_used if row else 0,
+        })
+    return rollups
@@ -0,0 +1,84 @@
+"""
+Database Configuration Module
+Builds the SQLAlchemy URI and engine options from the environment, and tunes
+SQLite connections (WAL, busy timeout, mmap, cache) for concurrent access
+"""
+import os
+
+from sqlalchemy import event
+
+DEFAULT_DATABASE_URL = 'sqlite:///zenflow.db'
+
+# SQLite pragmas applied to every new connection
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE = int(os.getenv('SQLITE_CACHE_SIZE', '-64000'))  # negative = KiB
+
+# Connection pool sizing for server databases (PostgreSQL, MySQL)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+
+
+def get_database_url():
+    """DATABASE_URL from the environment, defaulting to the local SQLite file"""
+    url = os.getenv('DATABASE_URL', DEFAULT_DATABASE_URL)
+    # Heroku-style URLs use the scheme SQLAlchemy dropped in 1.4
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def is_sqlite(url):
+    return url.startswith('sqlite')
+
+
+def get_engine_options(url):
+    """Engine options: a busy-waiting SQLite driver, or a sized, pre-pinged pool for server databases"""
+    if is_sqlite(url):
+        return {
+            "connect_args": {
+                "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000,
+                # Connections are handed between request and worker threads by the pool
+                "check_same_thread": False,
+            },
+        }
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+
+def configure_database(app):
+    """Set the SQLAlchemy config keys on the app; call before db.init_app(app)"""
+    url = get_database_url()
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = get_engine_options(url)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record=None):
+    """
+    WAL lets readers run alongside the single writer, and busy_timeout makes
+    writers wait for the lock instead of failing with "database is locked".
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+    cursor.close()
+
+
+def install_engine_hooks(app, db):
+    """Register the SQLite pragma hook on the app's engine; call after db.init_app(app)"""
+    if not is_sqlite(app.config['SQLALCHEMY_DATABASE_URI']):
+        return
+    with app.app_context():
+        event.listen(db.engine, "connect", apply_sqlite_pragmas)
@@ -0,0 +1,78 @@
+"""
+Encryption Module
+Builds the Fernet cipher once per process and exposes single and batch
+encrypt/decrypt helpers. Supports key rotation through MultiFernet.
+"""
+import base64
+import hashlib
+import os
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+
+DEFAULT_ENCRYPTION_KEY = 'your-secret-key-for-encryption-change-this-in-production'
+
+
+def get_encryption_secrets():
+    """
+    Secrets in priority order. ENCRYPTION_KEYS="new,old" enables rotation:
+    the first secret encrypts, and every secret is tried when decrypting.
+    """
+    keys = [key.strip() for key in os.getenv('ENCRYPTION_KEYS', '').split(',') if key.strip()]
+    if not keys:
+        keys = [os.getenv('ENCRYPTION_KEY', DEFAULT_ENCRYPTION_KEY)]
+    return keys
+
+
+def derive_fernet_key(secret):
+    """Derive a Fernet key from an arbitrary secret string (SHA-256, URL-safe base64)"""
+    return base64.urlsafe_b64encode(hashlib.sha256(secret.encode()).digest())
+
+
+def build_cipher(secrets=None):
+    return MultiFernet([Fernet(derive_fernet_key(secret)) for secret in (secrets or get_encryption_secrets())])
+
+
+# Key derivation and Fernet setup happen once, not on every call
+_cipher = build_cipher()
+
+
+def get_cipher():
+    return _cipher
+
+
+def encrypt_password(password):
+    """Encrypt password using Fernet encryption"""
+    if not password:
+        return None
+    return _cipher.encrypt(password.encode()).decode()
+
+
+def decrypt_password(encrypted_password):
+    """Decrypt password using Fernet encryption"""
+    if not encrypted_password:
+        return None
+    return _cipher.decrypt(encrypted_password.encode()).decode()
+
+
+def decrypt_many(encrypted_values, on_error=None):
+    """
+    Decrypt a list of values with the shared cipher.
+    Blank values come back as None, and values that fail to decrypt come back as `on_error`.
+    """
+    results = []
+    for value in encrypted_values:
+        if not value:
+            results.append(None)
+            continue
+        try:
+            results.append(_cipher.decrypt(value.encode()).decode())
+        except (InvalidToken, ValueError):
+            results.append(on_error)
+    return results
+
+
+def rotate_token(encrypted_value):
+    """Re-encrypt a value under the primary key (the first in ENCRYPTION_KEYS)"""
+    if not encrypted_value:
+        return encrypted_value
+    return _cipher.rotate(encrypted_value.encode()).decode()
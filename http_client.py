@@ -0,0 +1,164 @@
+"""
+Shared HTTP Client Module
+One pooled, keep-alive requests session for all Graph API traffic, with
+default timeouts, retry/backoff on 429 and 5xx, and connection pool counters
+"""
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import MaxRetryError
+from urllib3.util.retry import Retry
+
+HTTP_POOL_CONNECTIONS = int(os.getenv('IG_HTTP_POOL_CONNECTIONS', '10'))
+HTTP_POOL_SIZE = int(os.getenv('IG_HTTP_POOL_SIZE', '20'))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('IG_HTTP_CONNECT_TIMEOUT', '3.05'))
+HTTP_READ_TIMEOUT = float(os.getenv('IG_HTTP_READ_TIMEOUT', '15'))
+HTTP_MAX_RETRIES = int(os.getenv('IG_HTTP_MAX_RETRIES', '3'))
+HTTP_BACKOFF_FACTOR = float(os.getenv('IG_HTTP_BACKOFF_FACTOR', '0.5'))
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class PoolStats:
+    """Thread-safe counters for connection pool checkouts"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.misses = 0
+
+    def record_checkout(self):
+        with self._lock:
+            self.checkouts += 1
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "hits": self.checkouts - self.misses,
+                "misses": self.misses,
+            }
+
+
+pool_stats = PoolStats()
+
+
+class _CountingPoolMixin:
+    """Counts every connection checkout, and every new connection as a miss"""
+
+    def _get_conn(self, timeout=None):
+        pool_stats.record_checkout()
+        return super()._get_conn(timeout=timeout)
+
+    def _new_conn(self):
+        pool_stats.record_miss()
+        return super()._new_conn()
+
+
+class CountingHTTPConnectionPool(_CountingPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class CountingHTTPSConnectionPool(_CountingPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class GraphRetry(Retry):
+    """
+    Retry GETs on connection errors, read errors and 429/5xx.
+
+    POST is left out of allowed_methods and never retried after an error: a
+    read timeout or dropped connection can come after Graph already posted
+    the reply (or a whole batch of replies). The one POST retry is a 429,
+    which Graph returns before doing any work.
+    """
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if method and method.upper() == 'POST':
+            return bool(self.total) and status_code == 429
+        return super().is_retry(method, status_code, has_retry_after)
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        if error is not None and method and method.upper() == 'POST':
+            # Wrapped like an exhausted retry so requests raises ConnectionError/ConnectTimeout
+            raise MaxRetryError(_pool, url, error) from error
+        return super().increment(method=method, url=url, response=response, error=error,
+                                 _pool=_pool, _stacktrace=_stacktrace)
+
+
+class CountingHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': CountingHTTPConnectionPool,
+            'https': CountingHTTPSConnectionPool,
+        }
+
+
+class TimeoutSession(requests.Session):
+    """requests.Session that applies a default (connect, read) timeout"""
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.default_timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.default_timeout)
+        return super().request(method, url, **kwargs)
+
+
+def build_session(pool_connections=HTTP_POOL_CONNECTIONS, pool_size=HTTP_POOL_SIZE,
+                  connect_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=HTTP_READ_TIMEOUT,
+                  max_retries=HTTP_MAX_RETRIES, backoff_factor=HTTP_BACKOFF_FACTOR):
+    """Build a pooled session with retry and timeout defaults"""
+    retry = GraphRetry(
+        total=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(['GET']),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = CountingHTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_size,
+        max_retries=retry,
+    )
+    session = TimeoutSession(timeout=(connect_timeout, read_timeout))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """Return the process-wide shared session, creating it on first use"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = build_session()
+    return _session
+
+
+def get_http_pool_stats():
+    """Connection pool hit/miss counters plus the active pool configuration"""
+    stats = pool_stats.snapshot()
+    stats.update({
+        "pool_connections": HTTP_POOL_CONNECTIONS,
+        "pool_size": HTTP_POOL_SIZE,
+        "connect_timeout": HTTP_CONNECT_TIMEOUT,
+        "read_timeout": HTTP_READ_TIMEOUT,
+        "max_retries": HTTP_MAX_RETRIES,
+    })
+    return stats
@@ -4,18 +4,56 @@ Handles Instagram OAuth, API calls, and webhook processing
 """
 import requests
 import json
-from datetime import datetime, timedelta
-from models import db, User
+from urllib.parse import urlencode
+from datetime import datetime, timedelta, timezone
+from models import db, User, AutomatedMedia
+from http_client import get_http_session
 import os
 import time
 import random
 
+# Graph API error code for an invalid or expired access token
+TOKEN_EXPIRED_CODE = 190
+# Graph API cap on sub-requests in one batch call
+GRAPH_BATCH_LIMIT = 50
+
+
+def parse_graph_timestamp(value):
+    """'2024-05-01T12:00:00+0000' -> naive UTC datetime, or None"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%dT%H:%M:%S%z').astimezone(timezone.utc).replace(tzinfo=None)
+    except (TypeError, ValueError):
+        return None
+
 
 class InstagramAPI:
-    def __init__(self, access_token):
+    def __init__(self, access_token, session=None):
         self.access_token = access_token
+        self.session = session or get_http_session()
         self.base_url = "https://graph.instagram.com"
         self.api_version = "v18.0"
+        self.last_error_code = None
+        self.last_error_status = None
+
+    def _record_error(self, error):
+        """Remember the Graph API error code and HTTP status of the last failed call"""
+        self.last_error_code = None
+        response = getattr(error, 'response', None)
+        self.last_error_status = response.status_code if response is not None else None
+        if response is not None:
+            try:
+                self.last_error_code = response.json().get('error', {}).get('code')
+            except ValueError:
+                pass
+
+    @property
+    def token_expired(self):
+        return self.last_error_code == TOKEN_EXPIRED_CODE
+
+    @property
+    def last_error_rejected(self):
+        """True if Graph answered the last failed call with a 4xx, so it definitely did nothing"""
+        return self.last_error_status is not None and 400 <= self.last_error_status < 500
 
     def get_user_profile(self):
         """Get Instagram user profile information"""
@@ -26,46 +64,74 @@ class InstagramAPI:
         }
         
         try:
-            response = requests.get(url, params=params)
+            response = self.session.get(url, params=params)
             response.raise_for_status()
             return response.json()
         except requests.RequestException as e:
+            self._record_error(e)
             print(f"Error fetching Instagram profile: {str(e)}")
             return None
 
-    def get_user_media(self, limit=20):
-        """Get user's media posts"""
+    def get_user_media(self, limit=20, after=None):
+        """Get one page of the user's media posts, newest first; pass `after` from paging.cursors for the next page"""
         url = f"{self.base_url}/me/media"
         params = {
             'fields': 'id,caption,media_type,media_url,permalink,timestamp,thumbnail_url,children',
             'access_token': self.access_token,
             'limit': limit
         }
+        if after:
+            params['after'] = after
         
         try:
-            response = requests.get(url, params=params)
+            response = self.session.get(url, params=params)
             response.raise_for_status()
             return response.json()
         except requests.RequestException as e:
+            self._record_error(e)
             print(f"Error fetching Instagram media: {str(e)}")
             return None
 
-    def get_media_comments(self, media_id):
-        """Get comments for a specific media post"""
+    def get_media_comments(self, media_id, after=None):
+        """Get one page of comments for a media post, newest first; pass `after` for the next page"""
         url = f"{self.base_url}/{media_id}/comments"
         params = {
             'fields': 'id,text,timestamp,username,replies',
             'access_token': self.access_token
         }
+        if after:
+            params['after'] = after
         
         try:
-            response = requests.get(url, params=params)
+            response = self.session.get(url, params=params)
             response.raise_for_status()
             return response.json()
         except requests.RequestException as e:
             print(f"Error fetching comments for media {media_id}: {str(e)}")
             return None
 
+    def get_comments_for_media(self, media_ids, limit=25):
+        """
+        First page of comments for up to MULTI_ID_LIMIT media in one multi-id read.
+        Returns {media_id: comments_page}, or None if the request failed.
+        """
+        params = {
+            'ids': ','.join(media_ids),
+            'fields': f'comments.limit({limit}){{{COMMENT_FIELDS}}}',
+            'access_token': self.access_token
+        }
+        
+        try:
+            response = self.session.get(f"{self.base_url}/", params=params)
+            response.raise_for_status()
+            data = response.json()
+        except requests.RequestException as e:
+            self._record_error(e)
+            print(f"Error fetching comments for {len(media_ids)} media: {str(e)}")
+            return None
+        # Media without comments come back without a `comments` field
+        return {media_id: item.get('comments', {'data': []}) for media_id, item in data.items()}
+
     def send_direct_message(self, recipient_id, message):
         """Send direct message to user (requires proper permissions)"""
         # Note: Direct messaging via Instagram Graph API has strict requirements
@@ -77,7 +143,7 @@ class InstagramAPI:
         }
         
         try:
-            response = requests.post(url, data=data)
+            response = self.session.post(url, data=data)
             response.raise_for_status()
             return response.json()
         except requests.RequestException as e:
@@ -93,13 +159,18 @@ class InstagramAPI:
         }
         
         try:
-            response = requests.post(url, data=data)
+            response = self.session.post(url, data=data)
             response.raise_for_status()
             return response.json()
         except requests.RequestException as e:
+            self._record_error(e)
             print(f"Error posting comment on media {media_id}: {str(e)}")
             return None
 
+    def batch(self, limit=GRAPH_BATCH_LIMIT):
+        """Start a GraphBatch that sends queued calls with this token, `limit` per HTTP request"""
+        return GraphBatch(self, limit=limit)
+
     def get_account_insights(self):
         """Get account insights (requires proper permissions)"""
         # This requires Instagram Business Account and specific permissions
@@ -110,7 +181,7 @@ class InstagramAPI:
         }
         
         try:
-            response = requests.get(url, params=params)
+            response = self.session.get(url, params=params)
             response.raise_for_status()
             return response.json()
         except requests.RequestException as e:
@@ -118,6 +189,135 @@ class InstagramAPI:
             return None
 
 
+class BatchRequest:
+    """One queued sub-request of a GraphBatch; `result`/`error` are set when the batch is flushed"""
+
+    def __init__(self, method, relative_url, body=None):
+        self.method = method
+        self.relative_url = relative_url
+        self.body = body
+        self.done = False
+        self.status = None
+        self.result = None
+        self.error = None
+        self.error_code = None
+
+    @property
+    def ok(self):
+        return self.done and self.error is None
+
+    @property
+    def rejected(self):
+        """
+        True only if Graph answered this request with an error status.
+
+        A transport failure or a null sub-response leaves the outcome unknown:
+        a POST may still have gone through.
+        """
+        return self.done and self.status is not None and self.status >= 400
+
+    def to_dict(self):
+        entry = {'method': self.method, 'relative_url': self.relative_url}
+        if self.body:
+            entry['body'] = urlencode(self.body)
+        return entry
+
+    def resolve(self, response):
+        """Fill in the outcome from this sub-request's entry in the batch response"""
+        self.done = True
+        if response is None:
+            # Graph returns null for sub-requests it did not get to before timing out
+            self.error = "No response for batched request"
+            return
+        self.status = response.get('code')
+        try:
+            body = json.loads(response.get('body') or 'null')
+        except ValueError:
+            body = None
+        if self.status and self.status >= 400:
+            error = (body or {}).get('error', {}) if isinstance(body, dict) else {}
+            self.error = error.get('message') or f"HTTP {self.status}"
+            self.error_code = error.get('code')
+        else:
+            self.result = body
+
+    def fail(self, error, status=None):
+        self.done = True
+        self.status = status
+        self.error = error
+
+
+class GraphBatch:
+    """
+    Queue of Graph API calls sent as batch requests of up to `limit` sub-requests.
+
+    get()/post() return a BatchRequest straight away. The queue is sent when it
+    reaches `limit`, on flush(), or when a `with api.batch() as batch:` block
+    exits; each BatchRequest then carries its own result or error, so one
+    failed sub-request never affects the others.
+    """
+
+    def __init__(self, api, limit=GRAPH_BATCH_LIMIT):
+        self.api = api
+        self.limit = min(limit, GRAPH_BATCH_LIMIT)
+        self.pending = []
+        self.requests_sent = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+        return False
+
+    def add(self, method, path, params=None, body=None):
+        query = {key: value for key, value in (params or {}).items() if value is not None}
+        relative_url = f"{path}?{urlencode(query)}" if query else path
+        request = BatchRequest(method, relative_url, body)
+        self.pending.append(request)
+        if len(self.pending) >= self.limit:
+            self.flush()
+        return request
+
+    def get(self, path, **params):
+        return self.add('GET', path, params=params)
+
+    def post(self, path, **data):
+        return self.add('POST', path, body=data)
+
+    def flush(self):
+        """Send everything queued, `limit` sub-requests per HTTP call"""
+        while self.pending:
+            chunk, self.pending = self.pending[:self.limit], self.pending[self.limit:]
+            self._send(chunk)
+
+    def _send(self, chunk):
+        data = {
+            'batch': json.dumps([request.to_dict() for request in chunk]),
+            'include_headers': 'false',
+            'access_token': self.api.access_token
+        }
+        self.requests_sent += 1
+        try:
+            response = self.api.session.post(f"{self.api.base_url}/", data=data)
+            response.raise_for_status()
+            responses = response.json()
+        except Exception as e:
+            # Any failure fails the whole chunk, so callers never lose track of their requests
+            status = None
+            if isinstance(e, requests.RequestException):
+                self.api._record_error(e)
+                if self.api.last_error_rejected:
+                    status = self.api.last_error_status  # Graph refused the whole batch, so none of it ran
+            print(f"Error sending Graph batch of {len(chunk)} requests: {str(e)}")
+            for request in chunk:
+                request.fail(str(e), status)
+            return
+
+        for i, request in enumerate(chunk):
+            request.resolve(responses[i] if i < len(responses) else None)
+
+
 def exchange_short_lived_token(short_lived_token):
     """Exchange short-lived token for long-lived token"""
     url = "https://graph.instagram.com/access_token"
@@ -128,7 +328,7 @@ def exchange_short_lived_token(short_lived_token):
     }
     
     try:
-        response = requests.get(url, params=params)
+        response = get_http_session().get(url, params=params)
         response.raise_for_status()
         return response.json()
     except requests.RequestException as e:
@@ -149,7 +349,7 @@ def refresh_long_lived_token(user):
             'access_token': user.ig_access_token
         }
         
-        response = requests.get(refresh_url, params=params)
+        response = get_http_session().get(refresh_url, params=params)
         response.raise_for_status()
         data = response.json()
         
@@ -176,7 +376,7 @@ def validate_token(access_token):
     }
     
     try:
-        response = requests.get(url, params=params)
+        response = get_http_session().get(url, params=params)
         if response.status_code == 200:
             return True
         else:
@@ -189,32 +389,136 @@ def validate_token(access_token):
             return False
 
 
+# Max comment pages read per media when catching up past its cursor
+COMMENT_FETCH_MAX_PAGES = int(os.getenv('IG_COMMENT_FETCH_MAX_PAGES', '5'))
+# Graph API cap on object ids in one ?ids= read
+MULTI_ID_LIMIT = 50
+COMMENT_FIELDS = 'id,text,timestamp,username,from'
+
+
+def filter_new_comments(page, cursor=None):
+    """
+    Split a newest-first comments page against `cursor`, a (timestamp, comment_id) pair.
+    Returns (new_comments, reached_cursor).
+    """
+    since, last_id = cursor if cursor else (None, None)
+    comments = []
+    reached_cursor = False
+    for comment in page.get('data', []):
+        created_at = parse_graph_timestamp(comment.get('timestamp'))
+        if since and created_at and (created_at < since or (created_at == since and comment['id'] == last_id)):
+            reached_cursor = True
+            continue
+        comments.append(comment)
+    return comments, reached_cursor
+
+
+def fetch_first_comment_pages(instagram_api, media_ids):
+    """First comment page of every media, MULTI_ID_LIMIT ids per request; failed chunks are left out"""
+    pages = {}
+    for i in range(0, len(media_ids), MULTI_ID_LIMIT):
+        chunk = instagram_api.get_comments_for_media(media_ids[i:i + MULTI_ID_LIMIT])
+        if chunk:
+            pages.update(chunk)
+    return pages
+
+
+def fetch_new_comments_batched(instagram_api, media_items, cursors=None, first_pages=None,
+                               max_pages=COMMENT_FETCH_MAX_PAGES):
+    """
+    Fetch comments newer than each media's cursor for many media at once.
+    Returns (results, errors): results is a list of (media, comments_data) in the
+    original media order, errors lists the media whose fetch failed.
+
+    Pages are read newest first in rounds: every media that still needs a page
+    gets it through one Graph batch, so a round costs one request per 50 media.
+    Paging stops per media once a page reaches its cursor (only the first page
+    is read for media without a cursor). `first_pages` are prefetched first
+    pages, e.g. from fetch_first_comment_pages.
+    """
+    cursors = cursors or {}
+    first_pages = first_pages or {}
+    comments = {media['id']: [] for media in media_items}
+    failed = {}
+    pages_read = {}
+
+    # media id -> `after` cursor of the page to read next (None for the first page)
+    pending = {media['id']: None for media in media_items}
+    while pending:
+        pages = {}
+        queued = {}
+        with instagram_api.batch() as batch:
+            for media_id, after in pending.items():
+                if after is None and media_id in first_pages:
+                    pages[media_id] = first_pages[media_id]
+                else:
+                    queued[media_id] = batch.get(f"{media_id}/comments", fields=COMMENT_FIELDS, after=after)
+        for media_id, request in queued.items():
+            if request.ok:
+                pages[media_id] = request.result or {}
+            else:
+                failed[media_id] = request.error
+
+        pending = {}
+        for media_id, page in pages.items():
+            pages_read[media_id] = pages_read.get(media_id, 0) + 1
+            new_comments, reached_cursor = filter_new_comments(page, cursors.get(media_id))
+            comments[media_id].extend(new_comments)
+
+            paging = page.get('paging', {})
+            after = paging.get('cursors', {}).get('after')
+            page_limit = max_pages if media_id in cursors else 1
+            if not reached_cursor and paging.get('next') and after and pages_read[media_id] < page_limit:
+                pending[media_id] = after
+
+    results = [(media, {'data': comments[media['id']]}) for media in media_items if media['id'] not in failed]
+    errors = [{'media_id': media_id, 'error': error} for media_id, error in failed.items()]
+    return results, errors
+
+
 def get_recent_mentions(user):
-    """Get recent mentions and comments for the user"""
+    """
+    Get comments posted since the last poll on the user's active automated media.
+    Returns (mentions, errors) so one failing media doesn't drop the whole poll.
+    Call comment_cursors.advance_comment_cursors once the mentions are processed.
+    """
+    from comment_cursors import load_comment_cursors
+
+    # Only posts the user switched on in the dashboard are polled
+    media_items = [
+        {'id': media_id, 'caption': caption or ''}
+        for media_id, caption in db.session.query(AutomatedMedia.media_id, AutomatedMedia.caption).filter(
+            AutomatedMedia.user_id == user.id,
+            AutomatedMedia.is_active.is_(True)
+        ).all()
+    ]
+    if not media_items:
+        return [], []
+    
     instagram_api = InstagramAPI(user.ig_access_token)
+    media_ids = [media['id'] for media in media_items]
     
-    # First get user's recent media
-    media_data = instagram_api.get_user_media(limit=10)
-    if not media_data:
-        return []
+    # First comment pages for all media in as few requests as possible; media
+    # that need more pages (or whose chunk failed) are caught up in Graph batches
+    cursors = load_comment_cursors(user.id, media_ids)
+    first_pages = fetch_first_comment_pages(instagram_api, media_ids)
+    results, errors = fetch_new_comments_batched(instagram_api, media_items, cursors=cursors, first_pages=first_pages)
     
     mentions = []
-    for media in media_data.get('data', []):
-        # Get comments for each media
-        comments_data = instagram_api.get_media_comments(media['id'])
-        if comments_data:
-            for comment in comments_data.get('data', []):
-                mentions.append({
-                    'type': 'comment',
-                    'media_id': media['id'],
-                    'media_caption': media.get('caption', ''),
-                    'comment_id': comment['id'],
-                    'username': comment['username'],
-                    'text': comment['text'],
-                    'timestamp': comment['timestamp']
-                })
+    for media, comments_data in results:
+        for comment in comments_data.get('data', []):
+            mentions.append({
+                'type': 'comment',
+                'media_id': media['id'],
+                'media_caption': media.get('caption', ''),
+                'comment_id': comment['id'],
+                'username': comment['username'],
+                'from_id': comment.get('from', {}).get('id'),
+                'text': comment['text'],
+                'timestamp': comment['timestamp']
+            })
     
-    return mentions
+    return mentions, errors
 
 
 def process_webhook_payload(payload):
@@ -225,15 +529,17 @@ def process_webhook_payload(payload):
     entries = payload.get('entry', [])
     
     for entry in entries:
+        # The entry id is the Instagram account that received the update
+        account_id = entry.get('id')
         changes = entry.get('changes', [])
         
         for change in changes:
             field = change.get('field')
             value = change.get('value', {})
             
-            if field == 'instagram_comments':
+            if field in ('instagram_comments', 'comments'):
                 # Handle new comments
-                process_new_comment(value)
+                process_new_comment(value, account_id)
             elif field == 'instagram_mentions':
                 # Handle new mentions
                 process_new_mention(value)
@@ -245,14 +551,46 @@ def process_webhook_payload(payload):
                 process_reel_update(value)
 
 
-def process_new_comment(comment_value):
-    """Process new comment notification from webhook"""
-    comment_id = comment_value.get('comment_id')
-    media_id = comment_value.get('media_id')
+def process_new_comment(comment_value, account_id=None):
+    """Process new comment notification from webhook and run the owner's automation"""
+    # Accept both the legacy flat shape and the Graph API `comments` field shape
+    comment_id = comment_value.get('comment_id') or comment_value.get('id')
+    media_id = comment_value.get('media_id') or comment_value.get('media', {}).get('id')
     text = comment_value.get('text')
-    username = comment_value.get('user_name')
+    username = comment_value.get('user_name') or comment_value.get('from', {}).get('username')
     
     print(f"New comment: {username} commented '{text}' on media {media_id}")
+    
+    if not account_id or not comment_id or not media_id:
+        return
+    
+    user = User.query.filter_by(ig_user_id=account_id).first()
+    if not user or not user.ig_access_token:
+        return
+    
+    # Imported lazily: automation depends on this module
+    from automation import is_own_comment, process_comment_event
+    mention_data = {
+        'type': 'comment',
+        'media_id': media_id,
+        'comment_id': comment_id,
+        'username': username,
+        'from_id': comment_value.get('from', {}).get('id'),
+        'text': text or '',
+        'timestamp': comment_value.get('timestamp')
+    }
+    if is_own_comment(user, mention_data, account_id):
+        return  # The account's own replies must never trigger another reply
+    
+    # Only posts the user switched on in the dashboard are automated, as in polling
+    is_active = db.session.query(AutomatedMedia.id).filter(
+        AutomatedMedia.user_id == user.id,
+        AutomatedMedia.media_id == media_id,
+        AutomatedMedia.is_active.is_(True)
+    ).first() is not None
+    if not is_active:
+        return
+    process_comment_event(user, mention_data)
 
 
 def process_new_mention(mention_value):
@@ -0,0 +1,132 @@
+"""
+Instagram Cache Module
+Per-user cache of Graph API profile and media metadata for the dashboard.
+Fresh entries are served as-is; stale ones are served immediately while a
+background worker refreshes them (stale-while-revalidate). Only a missing
+or very old entry makes the request wait on the Graph API.
+"""
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from models import db, User, InstagramCache
+from instagram_api import InstagramAPI
+
+IG_CACHE_TTL = int(os.getenv('IG_CACHE_TTL', '300'))
+IG_CACHE_STALE_TTL = int(os.getenv('IG_CACHE_STALE_TTL', '86400'))
+IG_CACHE_REFRESH_WORKERS = int(os.getenv('IG_CACHE_REFRESH_WORKERS', '2'))
+IG_CACHE_MEDIA_LIMIT = int(os.getenv('IG_CACHE_MEDIA_LIMIT', '25'))
+
+
+class TokenExpired(Exception):
+    """The user's Instagram token was rejected and could not be refreshed"""
+
+
+class FetchFailed(Exception):
+    """The Graph API call failed for a reason other than the token"""
+
+
+def fetch_profile(api):
+    return api.get_user_profile()
+
+
+def fetch_media_items(api):
+    data = api.get_user_media(limit=IG_CACHE_MEDIA_LIMIT)
+    return data.get('data', []) if data is not None else None
+
+
+FETCHERS = {
+    'profile': fetch_profile,
+    'media': fetch_media_items,
+}
+
+
+def store_cached(user_id, kind, payload):
+    """Save a fresh payload for (user, kind) and commit"""
+    entry = db.session.get(InstagramCache, (user_id, kind))
+    if entry is None:
+        entry = InstagramCache(user_id=user_id, kind=kind)
+        db.session.add(entry)
+    entry.payload = json.dumps(payload)
+    entry.fetched_at = datetime.utcnow()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent refresh inserted the row first; its data is just as fresh
+        db.session.rollback()
+
+
+def invalidate_instagram_cache(user_id):
+    """Drop every cached entry for a user, e.g. after reconnecting or a rejected token; does not commit"""
+    InstagramCache.query.filter_by(user_id=user_id).delete()
+
+
+def refresh(user, kind):
+    """Fetch (user, kind) from the Graph API and store it; returns the payload"""
+    api = InstagramAPI(user.ig_access_token)
+    payload = FETCHERS[kind](api)
+    if payload is None:
+        if api.token_expired:
+            invalidate_instagram_cache(user.id)
+            db.session.commit()
+            raise TokenExpired()
+        raise FetchFailed(f"Failed to fetch Instagram {kind}")
+    store_cached(user.id, kind, payload)
+    return payload
+
+
+_executor = None
+_in_flight = set()
+_refresh_lock = threading.Lock()
+
+
+def schedule_refresh(user_id, kind):
+    """Refresh (user, kind) on the background pool unless a refresh is already running"""
+    global _executor
+    key = (user_id, kind)
+    with _refresh_lock:
+        if key in _in_flight:
+            return False
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=IG_CACHE_REFRESH_WORKERS, thread_name_prefix='ig-cache')
+        _in_flight.add(key)
+    _executor.submit(_background_refresh, current_app._get_current_object(), user_id, kind)
+    return True
+
+
+def _background_refresh(app, user_id, kind):
+    try:
+        with app.app_context():
+            user = db.session.get(User, user_id)
+            if user and user.ig_access_token:
+                refresh(user, kind)
+    except Exception as e:
+        print(f"Error refreshing Instagram {kind} for user {user_id}: {str(e)}")
+    finally:
+        with _refresh_lock:
+            _in_flight.discard((user_id, kind))
+
+
+def get_cached(user, kind):
+    """
+    Return (payload, fetched_at, stale) for the dashboard.
+
+    Raises TokenExpired or FetchFailed only when there is nothing usable in
+    the cache and the synchronous fetch fails.
+    """
+    entry = db.session.get(InstagramCache, (user.id, kind))
+    if entry is not None:
+        age = datetime.utcnow() - entry.fetched_at
+        if age <= timedelta(seconds=IG_CACHE_STALE_TTL):
+            stale = age > timedelta(seconds=IG_CACHE_TTL)
+            if stale:
+                schedule_refresh(user.id, kind)
+            return json.loads(entry.payload), entry.fetched_at, stale
+
+    payload = refresh(user, kind)
+    return payload, datetime.utcnow(), False
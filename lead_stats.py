@@ -0,0 +1,54 @@
+"""
+Lead Statistics Module
+Aggregates per-user lead counts for the dashboard pages in a single grouped query
+"""
+from datetime import datetime, timedelta
+
+from models import db, Lead
+
+CHART_DAYS = 7
+
+
+def get_chart_day_starts(days=CHART_DAYS):
+    """Return the UTC midnight of each of the last `days` days, oldest first"""
+    today = datetime.utcnow().date()
+    return [
+        datetime.combine(today - timedelta(days=i), datetime.min.time())
+        for i in range(days - 1, -1, -1)
+    ]
+
+
+def get_lead_stats(user_id, days=CHART_DAYS):
+    """
+    Compute total, per-status and daily lead counts for a user.
+
+    Everything comes back from one GROUP BY status query: each row carries the
+    status count plus one conditional SUM per chart day, so the dashboard never
+    has to load Lead rows into memory.
+    """
+    day_starts = get_chart_day_starts(days)
+
+    day_columns = []
+    for start in day_starts:
+        in_day = db.and_(Lead.timestamp >= start, Lead.timestamp < start + timedelta(days=1))
+        day_columns.append(db.func.sum(db.case((in_day, 1), else_=0)))
+
+    rows = db.session.query(
+        Lead.status, db.func.count(Lead.id), *day_columns
+    ).filter(Lead.user_id == user_id).group_by(Lead.status).all()
+
+    status_counts = {}
+    daily_counts = [0] * days
+    for status, count, *per_day in rows:
+        status_counts[status] = count
+        for i, day_count in enumerate(per_day):
+            daily_counts[i] += day_count or 0
+
+    return {
+        "total_leads": sum(status_counts.values()),
+        "status_counts": status_counts,
+        "chart_data": [
+            {"day": start.strftime('%a'), "count": count}
+            for start, count in zip(day_starts, daily_counts)
+        ]
+    }
@@ -0,0 +1,121 @@
+"""
+Media Import Module
+Imports a user's Instagram posts into AutomatedMedia. Pages through the Graph
+API with `after` cursors, stops at the newest post already imported, diffs
+the batch against existing rows in one query and writes it in bulk.
+"""
+import os
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, AutomatedMedia
+from instagram_api import InstagramAPI, parse_graph_timestamp
+
+MEDIA_IMPORT_PAGE_SIZE = int(os.getenv('IG_MEDIA_IMPORT_PAGE_SIZE', '100'))
+MEDIA_IMPORT_MAX_PAGES = int(os.getenv('IG_MEDIA_IMPORT_MAX_PAGES', '50'))
+
+# Keeps IN (...) lists under SQLite's bound-parameter limit
+MEDIA_DIFF_CHUNK = 500
+
+
+class MediaImportError(Exception):
+    """A Graph API page could not be fetched, so nothing was imported"""
+
+
+def fetch_media_since(api, since=None, page_size=MEDIA_IMPORT_PAGE_SIZE, max_pages=MEDIA_IMPORT_MAX_PAGES):
+    """
+    Newest-first media posted at or after `since` (everything when None).
+
+    The Graph API lists media newest first, so paging stops at the first post
+    older than `since`. A failed page raises MediaImportError rather than
+    returning a partial list: a partial import would move the high-water mark
+    past posts that were never fetched.
+    """
+    items = []
+    after = None
+    for _ in range(max_pages):
+        page = api.get_user_media(limit=page_size, after=after)
+        if page is None:
+            raise MediaImportError("Failed to fetch Instagram media")
+
+        for media in page.get('data', []):
+            posted_at = parse_graph_timestamp(media.get('timestamp'))
+            if since and posted_at and posted_at < since:
+                return items
+            items.append(media)
+
+        paging = page.get('paging', {})
+        after = paging.get('cursors', {}).get('after')
+        if not paging.get('next') or not after:
+            break
+    return items
+
+
+def media_row(media):
+    """AutomatedMedia column values for one Graph API media object"""
+    return {
+        "thumbnail_url": media.get('thumbnail_url') or media.get('media_url'),
+        "caption": media.get('caption', ''),
+        "media_type": media.get('media_type'),
+        "permalink": media.get('permalink'),
+        "posted_at": parse_graph_timestamp(media.get('timestamp')),
+    }
+
+
+def upsert_media(user_id, items):
+    """Insert new media and refresh existing rows in bulk; returns (added, updated). Does not commit."""
+    rows = {media['id']: media_row(media) for media in items if media.get('id')}
+    media_ids = list(rows)
+
+    existing = {}
+    for i in range(0, len(media_ids), MEDIA_DIFF_CHUNK):
+        existing.update(
+            db.session.query(AutomatedMedia.media_id, AutomatedMedia.id)
+            .filter(AutomatedMedia.user_id == user_id,
+                    AutomatedMedia.media_id.in_(media_ids[i:i + MEDIA_DIFF_CHUNK]))
+            .all()
+        )
+
+    new_rows = [
+        # Imported posts start paused; users opt each one in from the dashboard
+        {"user_id": user_id, "media_id": media_id, "is_active": False, **row}
+        for media_id, row in rows.items() if media_id not in existing
+    ]
+    changed_rows = [
+        {"id": existing[media_id], **row}
+        for media_id, row in rows.items() if media_id in existing
+    ]
+
+    if new_rows:
+        db.session.execute(db.insert(AutomatedMedia), new_rows)
+    if changed_rows:
+        db.session.execute(db.update(AutomatedMedia), changed_rows)
+    return len(new_rows), len(changed_rows)
+
+
+def import_user_media(user, full=False):
+    """
+    Import the user's posts and commit; returns {"fetched", "added", "updated"}.
+
+    By default only posts at or after the newest imported `posted_at` are
+    fetched. Pass full=True to walk the whole feed, e.g. to pick up edited
+    captions on older posts.
+    """
+    since = None
+    if not full:
+        since = db.session.query(db.func.max(AutomatedMedia.posted_at)).filter(
+            AutomatedMedia.user_id == user.id
+        ).scalar()
+
+    items = fetch_media_since(InstagramAPI(user.ig_access_token), since=since)
+
+    try:
+        added, updated = upsert_media(user.id, items)
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent import inserted some of the same posts; diff again against its rows
+        db.session.rollback()
+        added, updated = upsert_media(user.id, items)
+        db.session.commit()
+
+    return {"fetched": len(items), "added": added, "updated": updated}
@@ -28,6 +28,23 @@ def migrate():
             else:
                 print(f"Error adding {col_name}: {e}")
 
+    media_columns_to_add = [
+        ("media_type", "VARCHAR(20)"),
+        ("permalink", "VARCHAR(500)"),
+        ("posted_at", "DATETIME")
+    ]
+
+    for col_name, col_type in media_columns_to_add:
+        try:
+            print(f"Adding column {col_name} to automated_media table...")
+            cursor.execute(f"ALTER TABLE automated_media ADD COLUMN {col_name} {col_type}")
+            print(f"Successfully added {col_name}")
+        except sqlite3.OperationalError as e:
+            if "duplicate column name" in str(e).lower():
+                print(f"Column {col_name} already exists.")
+            else:
+                print(f"Error adding {col_name}: {e}")
+
     conn.commit()
     conn.close()
     print("Migration complete.")
@@ -0,0 +1,70 @@
+import sqlite3
+import os
+
+db_path = os.path.join('instance', 'zenflow.db')
+
+# Must stay in sync with the __table_args__ declared in models.py
+INDEXES = [
+    ("ix_user_used_founding_coupon", "user", ["used_founding_coupon"], False),
+    ("ix_funnel_user_id", "funnel", ["user_id"], False),
+    ("ix_lead_user_timestamp", "lead", ["user_id", "timestamp", "id"], False),
+    ("ix_lead_user_status_timestamp", "lead", ["user_id", "status", "timestamp"], False),
+    ("uq_automated_media_user_media", "automated_media", ["user_id", "media_id"], True),
+    ("ix_automated_media_user_active", "automated_media", ["user_id", "is_active"], False),
+    ("ix_automated_media_user_posted", "automated_media", ["user_id", "posted_at"], False),
+    ("ix_beta_signup_plan", "beta_signup", ["plan"], False),
+    ("ix_activity_log_timestamp", "activity_log", ["timestamp"], False),
+    ("ix_activity_log_user_timestamp", "activity_log", ["user_id", "timestamp"], False),
+    ("ix_instagram_connection_user_username", "instagram_connection", ["user_id", "ig_username"], False),
+    ("ix_instagram_connection_connected_at", "instagram_connection", ["connected_at"], False),
+]
+
+
+def remove_duplicate_media(cursor):
+    """Keep the oldest row for each (user_id, media_id) so the unique index can be built"""
+    cursor.execute('''
+        DELETE FROM automated_media
+        WHERE id NOT IN (
+            SELECT MIN(id) FROM automated_media GROUP BY user_id, media_id
+        )
+    ''')
+    if cursor.rowcount:
+        print(f"Removed {cursor.rowcount} duplicate automated_media rows.")
+
+
+def migrate():
+    if not os.path.exists(db_path):
+        print(f"Database not found at {db_path}")
+        return
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+    tables = {row[0] for row in cursor.fetchall()}
+
+    if "automated_media" in tables:
+        remove_duplicate_media(cursor)
+
+    for name, table, columns, unique in INDEXES:
+        if table not in tables:
+            print(f"Table {table} not found, skipping {name}.")
+            continue
+        try:
+            print(f"Creating index {name} on {table}({', '.join(columns)})...")
+            cursor.execute(
+                f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} "
+                f"ON \"{table}\" ({', '.join(columns)})"
+            )
+        except sqlite3.OperationalError as e:
+            print(f"Error creating {name}: {e}")
+
+    # Refresh planner statistics so the new indexes are picked up
+    cursor.execute("ANALYZE")
+
+    conn.commit()
+    conn.close()
+    print("Migration complete.")
+
+if __name__ == "__main__":
+    migrate()
@@ -4,6 +4,10 @@ from datetime import datetime
 db = SQLAlchemy()
 
 class User(db.Model):
+    __table_args__ = (
+        db.Index('ix_user_used_founding_coupon', 'used_founding_coupon'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True)
@@ -35,14 +39,24 @@ class User(db.Model):
     leads = db.relationship('Lead', backref='owner', lazy=True)
 
 class Funnel(db.Model):
+    __table_args__ = (
+        db.Index('ix_funnel_user_id', 'user_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    wakeword = db.Column(db.String(50), default="GROW")
+    wakeword = db.Column(db.String(200), default="GROW")  # Comma-separated, e.g. "GROW, INFO"
     script = db.Column(db.Text)
     link = db.Column(db.String(200))
     active = db.Column(db.Boolean, default=True)
 
 class Lead(db.Model):
+    __table_args__ = (
+        # Dashboard histogram, keyset paging and exports all scan by user, newest first
+        db.Index('ix_lead_user_timestamp', 'user_id', 'timestamp', 'id'),
+        db.Index('ix_lead_user_status_timestamp', 'user_id', 'status', 'timestamp'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     handle = db.Column(db.String(80), nullable=False)
@@ -51,14 +65,27 @@ class Lead(db.Model):
     niche_relevance = db.Column(db.String(50))
 
 class AutomatedMedia(db.Model):
+    __table_args__ = (
+        db.Index('uq_automated_media_user_media', 'user_id', 'media_id', unique=True),
+        db.Index('ix_automated_media_user_active', 'user_id', 'is_active'),
+        db.Index('ix_automated_media_user_posted', 'user_id', 'posted_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     media_id = db.Column(db.String(100), nullable=False)
     thumbnail_url = db.Column(db.String(500))
     is_active = db.Column(db.Boolean, default=True)
     caption = db.Column(db.Text)
+    media_type = db.Column(db.String(20))  # IMAGE, VIDEO or CAROUSEL_ALBUM
+    permalink = db.Column(db.String(500))
+    posted_at = db.Column(db.DateTime)  # Graph API timestamp, UTC; drives incremental imports
 
 class BetaSignup(db.Model):
+    __table_args__ = (
+        db.Index('ix_beta_signup_plan', 'plan'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
     email = db.Column(db.String(120), nullable=False)
@@ -68,6 +95,10 @@ class BetaSignup(db.Model):
 
 class ActivityLog(db.Model):
     __tablename__ = 'activity_log'
+    __table_args__ = (
+        db.Index('ix_activity_log_timestamp', 'timestamp'),
+        db.Index('ix_activity_log_user_timestamp', 'user_id', 'timestamp'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     action = db.Column(db.String(100), nullable=False)
@@ -89,6 +120,11 @@ class Review(db.Model):
 
 class InstagramConnection(db.Model):
     """Track Instagram connections for admin analytics"""
+    __table_args__ = (
+        db.Index('ix_instagram_connection_user_username', 'user_id', 'ig_username'),
+        db.Index('ix_instagram_connection_connected_at', 'connected_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     ig_username = db.Column(db.String(100), nullable=False)
@@ -98,4 +134,61 @@ class InstagramConnection(db.Model):
     last_used_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
     
-    user = db.relationship('User', backref=db.backref('instagram_connections', lazy=True))
\ No newline at end of file
+    user = db.relationship('User', backref=db.backref('instagram_connections', lazy=True))
+
+class InstagramConnectionDailyStats(db.Model):
+    """Per-day revenue and token totals across all Instagram connections"""
+    __tablename__ = 'instagram_connection_daily_stats'
+
+    day = db.Column(db.Date, primary_key=True)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    tokens_used = db.Column(db.Integer, nullable=False, default=0)
+
+class CapacityCounter(db.Model):
+    """Slots used for a limited offer (founding coupon, beta plans), claimed with a conditional UPDATE"""
+    __tablename__ = 'capacity_counter'
+
+    name = db.Column(db.String(50), primary_key=True)
+    used = db.Column(db.Integer, nullable=False, default=0)
+
+class InstagramCache(db.Model):
+    """Last Graph API profile/media response per user, served to the dashboard"""
+    __tablename__ = 'instagram_cache'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    kind = db.Column(db.String(20), primary_key=True)  # profile or media
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    fetched_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class CommentCursor(db.Model):
+    """Newest comment already polled on a media, so later polls only fetch comments after it"""
+    __tablename__ = 'comment_cursor'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    media_id = db.Column(db.String(100), primary_key=True)
+    last_comment_at = db.Column(db.DateTime, nullable=False)
+    last_comment_id = db.Column(db.String(100), nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ProcessedComment(db.Model):
+    """Comments that already triggered automation, so replies are never sent twice"""
+    comment_id = db.Column(db.String(100), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    media_id = db.Column(db.String(100))
+    processed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class TokenUsage(db.Model):
+    """Append-only ledger of token balance changes"""
+    __tablename__ = 'token_usage'
+    __table_args__ = (
+        db.Index('ix_token_usage_user_created', 'user_id', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    source = db.Column(db.String(20), nullable=False)  # free_tokens or paid_tokens
+    delta = db.Column(db.Integer, nullable=False)  # negative for spend, positive for grants/refunds
+    reason = db.Column(db.String(50), nullable=False)
+    reference = db.Column(db.String(100))  # e.g. the comment id that was answered
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,95 @@
+"""
+Page Cache Module
+Render cache for the public marketing pages. Anonymous visitors get a cached
+copy with an ETag and Cache-Control, and conditional GETs are answered with
+304 Not Modified. Logged-in users always get a fresh render.
+"""
+import hashlib
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import Response, make_response, request, session
+
+PAGE_CACHE_TTL = int(os.getenv('PAGE_CACHE_TTL', '60'))
+PAGE_CACHE_MAX_ENTRIES = int(os.getenv('PAGE_CACHE_MAX_ENTRIES', '256'))
+
+
+class PageCache:
+    """Rendered pages keyed by path and query string, each kept for `ttl` seconds"""
+
+    def __init__(self, ttl=PAGE_CACHE_TTL, max_entries=PAGE_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self.hits += 1
+                return entry
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+
+    def set(self, key, body, mimetype):
+        entry = (time.monotonic() + self.ttl, body, mimetype, hashlib.sha1(body).hexdigest())
+        with self._lock:
+            # Query strings are client-controlled, so bound the number of entries
+            while len(self._entries) >= self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = entry
+        return entry
+
+    def invalidate(self, path=None):
+        """Drop every cached page, or only the variants of one path"""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key.split('?', 1)[0] == path]:
+                del self._entries[key]
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "ttl": self.ttl,
+            }
+
+
+page_cache = PageCache()
+
+
+def cached_public_page(view):
+    """Serve `view` from the page cache for anonymous GETs"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method != 'GET' or 'user_id' in session:
+            return view(*args, **kwargs)
+
+        key = request.full_path
+        entry = page_cache.get(key)
+        if entry is None:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.direct_passthrough:
+                return response
+            entry = page_cache.set(key, response.get_data(), response.mimetype)
+
+        expires_at, body, mimetype, etag = entry
+        response = Response(body, mimetype=mimetype)
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = max(int(expires_at - time.monotonic()), 0)
+        # The same URL renders differently once the visitor logs in
+        response.vary.add('Cookie')
+        return response.make_conditional(request)
+    return wrapper
@@ -0,0 +1,75 @@
+"""
+Keyset Pagination Module
+Cursor-based (timestamp, id) paging so list endpoints never use OFFSET scans
+"""
+import base64
+from datetime import datetime
+
+from models import db
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(timestamp, row_id):
+    """Encode a (timestamp, id) position as an opaque URL-safe cursor"""
+    raw = f"{timestamp.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Decode a cursor back into (timestamp, id); returns None if it is malformed"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        timestamp, row_id = raw.split('|', 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def parse_page_size(value, default=DEFAULT_PAGE_SIZE):
+    """Clamp a requested page size to [1, MAX_PAGE_SIZE]"""
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def parse_date(value):
+    """Parse a YYYY-MM-DD (or full ISO) query argument; returns None if missing or invalid"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def keyset_paginate(query, timestamp_column, id_column, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Return one page of `query`, newest first, plus the cursor for the next page.
+
+    Rows are ordered by (timestamp DESC, id DESC) and the cursor holds the last
+    row's position, so each page is a range scan instead of an OFFSET.
+    """
+    position = decode_cursor(cursor)
+    if position:
+        last_timestamp, last_id = position
+        query = query.filter(db.or_(
+            timestamp_column < last_timestamp,
+            db.and_(timestamp_column == last_timestamp, id_column < last_id)
+        ))
+
+    # Fetch one extra row to learn whether another page exists
+    rows = query.order_by(timestamp_column.desc(), id_column.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = None
+    if has_more and rows:
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, timestamp_column.key), getattr(last, id_column.key))
+    return rows, next_cursor
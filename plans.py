@@ -0,0 +1,100 @@
+"""
+Plans Module
+Plan limits and the lazily-applied monthly free token reset
+"""
+from datetime import datetime, timedelta
+
+from models import db, User
+
+# Plan-based limits
+PLAN_LIMITS = {
+    "Free": {
+        "allow_media_import": False,
+        "max_active_media": 0,
+        "tokens": 4000
+    },
+    "Starter": {
+        "allow_media_import": True,
+        "max_active_media": 3,
+        "tokens": 10000
+    },
+    "Growth": {
+        "allow_media_import": True,
+        "max_active_media": 10,
+        "tokens": 50000
+    },
+    "Pro": {
+        "allow_media_import": True,
+        "max_active_media": None,
+        "tokens": 200000
+    },
+}
+
+TOKEN_RESET_PERIOD = timedelta(days=30)
+
+
+def get_plan_limits(plan):
+    return PLAN_LIMITS.get(plan or "Free", PLAN_LIMITS["Free"])
+
+
+def is_token_reset_due(tokens_reset_at, now=None):
+    """Free tokens refill when they were never set or the last reset is older than the period"""
+    now = now or datetime.utcnow()
+    return tokens_reset_at is None or now > tokens_reset_at + TOKEN_RESET_PERIOD
+
+
+def get_effective_free_tokens(user, now=None):
+    """Free token balance including a reset that is due but not yet written"""
+    if is_token_reset_due(user.tokens_reset_at, now):
+        return get_plan_limits(user.plan)["tokens"]
+    return user.free_tokens or 0
+
+
+def get_effective_balance(user, now=None):
+    """Read-only view of a user's tokens; never writes, so read paths take no write lock"""
+    free_tokens = get_effective_free_tokens(user, now)
+    paid_tokens = user.paid_tokens or 0
+    return {
+        "free_tokens": free_tokens,
+        "paid_tokens": paid_tokens,
+        "total_tokens": free_tokens + paid_tokens
+    }
+
+
+def _plan_tokens_expression():
+    """SQL CASE mapping User.plan to its monthly free tokens"""
+    return db.case(
+        *[(User.plan == plan, limits["tokens"]) for plan, limits in PLAN_LIMITS.items()],
+        else_=PLAN_LIMITS["Free"]["tokens"]
+    )
+
+
+def _reset_due_filter(cutoff):
+    return db.or_(User.tokens_reset_at.is_(None), User.tokens_reset_at < cutoff)
+
+
+def apply_due_token_reset(user_id, now=None):
+    """
+    Write a due reset for one user before spending from the balance.
+    Part of the caller's transaction; a no-op when no reset is due.
+    """
+    now = now or datetime.utcnow()
+    db.session.execute(
+        db.update(User)
+        .where(User.id == user_id, _reset_due_filter(now - TOKEN_RESET_PERIOD))
+        .values(free_tokens=_plan_tokens_expression(), tokens_reset_at=now)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def reset_due_tokens(now=None):
+    """Reset every eligible user's free tokens with one set-based UPDATE; returns the number of users reset"""
+    now = now or datetime.utcnow()
+    result = db.session.execute(
+        db.update(User)
+        .where(_reset_due_filter(now - TOKEN_RESET_PERIOD))
+        .values(free_tokens=_plan_tokens_expression(), tokens_reset_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
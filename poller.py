@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Standalone Instagram activity poller
+Runs the account poll scheduler and webhook queue consumers without the web
+server. Start one process per shard to spread accounts across cores or nodes, e.g.:
+
+    POLL_SHARD_INDEX=0 POLL_SHARD_COUNT=4 python poller.py
+    POLL_SHARD_INDEX=1 POLL_SHARD_COUNT=4 python poller.py
+"""
+import signal
+import threading
+
+from app import poll_scheduler, webhook_consumer
+
+
+def main():
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    print(f"Starting poller shard {poll_scheduler.shard_index + 1}/{poll_scheduler.shard_count} "
+          f"with {poll_scheduler.workers} workers")
+    poll_scheduler.start()
+    webhook_consumer.start()
+    stop.wait()
+
+    print("Stopping poller, waiting for in-flight accounts...")
+    webhook_consumer.stop()
+    poll_scheduler.stop(wait=True)
+
+
+if __name__ == "__main__":
+    main()
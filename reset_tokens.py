@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+"""
+Monthly free token reset job
+Resets every user whose reset period has elapsed in one set-based UPDATE.
+Run it from cron, e.g. hourly:
+
+    0 * * * * cd /path/to/app && python reset_tokens.py
+"""
+from app import app
+from plans import reset_due_tokens
+
+
+def main():
+    with app.app_context():
+        count = reset_due_tokens()
+    print(f"Reset free tokens for {count} user(s).")
+
+
+if __name__ == "__main__":
+    main()
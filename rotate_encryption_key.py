@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Re-encrypt stored Instagram passwords under the current primary key.
+
+1. Put the new secret first and keep the old one: ENCRYPTION_KEYS="new-secret,old-secret"
+2. Run: python rotate_encryption_key.py
+3. Once it reports no failures, drop the old secret from ENCRYPTION_KEYS.
+"""
+from cryptography.fernet import InvalidToken
+
+from app import app
+from encryption import rotate_token
+from models import db, User
+
+BATCH_SIZE = 500
+
+
+def rotate():
+    rotated = failed = 0
+    last_id = 0
+    with app.app_context():
+        while True:
+            rows = db.session.query(User.id, User.ig_password_encrypted).filter(
+                User.id > last_id,
+                User.ig_password_encrypted.isnot(None)
+            ).order_by(User.id).limit(BATCH_SIZE).all()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            updates = []
+            for user_id, encrypted in rows:
+                try:
+                    updates.append({"id": user_id, "ig_password_encrypted": rotate_token(encrypted)})
+                except InvalidToken:
+                    failed += 1
+                    print(f"Could not decrypt password for user {user_id} with any configured key.")
+
+            if updates:
+                db.session.execute(db.update(User), updates)
+                db.session.commit()
+                rotated += len(updates)
+            print(f"Re-encrypted {rotated} password(s) so far...")
+
+    print(f"Rotation complete: {rotated} re-encrypted, {failed} failed.")
+
+
+if __name__ == "__main__":
+    rotate()
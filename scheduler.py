@@ -0,0 +1,138 @@
+"""
+Account Poll Scheduler Module
+Polls connected accounts on a worker pool with per-account next-run times,
+jitter, in-flight de-duplication and user-id sharding across processes
+"""
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+POLL_INTERVAL_SECONDS = float(os.getenv('POLL_INTERVAL_SECONDS', '300'))
+POLL_JITTER_SECONDS = float(os.getenv('POLL_JITTER_SECONDS', '30'))
+POLL_WORKERS = int(os.getenv('POLL_WORKERS', '8'))
+POLL_TICK_SECONDS = float(os.getenv('POLL_TICK_SECONDS', '5'))
+POLL_SHARD_INDEX = int(os.getenv('POLL_SHARD_INDEX', '0'))
+POLL_SHARD_COUNT = int(os.getenv('POLL_SHARD_COUNT', '1'))
+
+
+class PollScheduler:
+    """
+    Runs `poll_account(account_id)` for every id returned by `list_accounts(shard_index, shard_count)`.
+
+    Each account has its own next-run time. An account that is still being
+    polled is never submitted again, so one slow account delays only itself.
+    New accounts get a random first slot inside the interval, and every later
+    run is pushed back by up to `jitter` seconds, so polls spread out instead
+    of firing all at once.
+    """
+
+    def __init__(self, list_accounts, poll_account, interval=POLL_INTERVAL_SECONDS,
+                 jitter=POLL_JITTER_SECONDS, workers=POLL_WORKERS, tick=POLL_TICK_SECONDS,
+                 shard_index=POLL_SHARD_INDEX, shard_count=POLL_SHARD_COUNT):
+        if not 0 <= shard_index < shard_count:
+            raise ValueError(f"shard_index must be in [0, {shard_count}), got {shard_index}")
+
+        self.list_accounts = list_accounts
+        self.poll_account = poll_account
+        self.interval = interval
+        self.jitter = jitter
+        self.workers = workers
+        self.tick = tick
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+
+        self._executor = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._next_run = {}
+        self._in_flight = set()
+
+        self.completed = 0
+        self.failed = 0
+        self.skipped_in_flight = 0
+
+    def start(self):
+        """Start the dispatcher thread and worker pool"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='poll-worker')
+        self._thread = threading.Thread(target=self._run, name='poll-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self, wait=True):
+        """Stop dispatching new polls and optionally wait for running ones"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.tick * 2)
+        if self._executor:
+            self._executor.shutdown(wait=wait)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.dispatch_due()
+            except Exception as e:
+                print(f"Error in poll scheduler: {str(e)}")
+            self._stop.wait(self.tick)
+
+    def dispatch_due(self, now=None):
+        """Submit every due, idle account of this shard; returns the ids submitted"""
+        now = now if now is not None else time.monotonic()
+        account_ids = set(self.list_accounts(self.shard_index, self.shard_count))
+        submitted = []
+
+        with self._lock:
+            # Forget accounts that disconnected or moved shards
+            for account_id in set(self._next_run) - account_ids:
+                del self._next_run[account_id]
+
+            for account_id in account_ids:
+                next_run = self._next_run.get(account_id)
+                if next_run is None:
+                    next_run = now + random.uniform(0, self.interval)
+                    self._next_run[account_id] = next_run
+                if next_run > now:
+                    continue
+                if account_id in self._in_flight:
+                    self.skipped_in_flight += 1
+                    continue
+                self._in_flight.add(account_id)
+                submitted.append(account_id)
+
+        for account_id in submitted:
+            self._executor.submit(self._poll, account_id)
+        return submitted
+
+    def _poll(self, account_id):
+        try:
+            self.poll_account(account_id)
+            succeeded = True
+        except Exception as e:
+            succeeded = False
+            print(f"Error polling account {account_id}: {str(e)}")
+
+        with self._lock:
+            self._in_flight.discard(account_id)
+            if account_id in self._next_run:
+                self._next_run[account_id] = time.monotonic() + self.interval + random.uniform(0, self.jitter)
+            if succeeded:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "shard_index": self.shard_index,
+                "shard_count": self.shard_count,
+                "workers": self.workers,
+                "accounts": len(self._next_run),
+                "in_flight": len(self._in_flight),
+                "completed": self.completed,
+                "failed": self.failed,
+                "skipped_in_flight": self.skipped_in_flight,
+            }
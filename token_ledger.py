@@ -0,0 +1,157 @@
+"""
+Token Ledger Module
+Atomic token debits and credits against the user balance columns, recorded in
+the append-only token_usage table, plus bulk reservations for batch replies
+"""
+from datetime import datetime
+
+from models import db, User, TokenUsage
+from plans import apply_due_token_reset
+
+TOKEN_SOURCES = ("free_tokens", "paid_tokens")
+
+
+def _balance_column(source):
+    if source not in TOKEN_SOURCES:
+        raise ValueError(f"Unknown token source: {source}")
+    return getattr(User, source)
+
+
+def _take(user_id, source, wanted):
+    """
+    Atomically take up to `wanted` tokens from one balance column; returns how many were taken.
+
+    The UPDATE only applies while the balance still covers the amount, so
+    concurrent workers can never drive a balance negative. If another writer
+    got there first, re-read and try again with what is left.
+    """
+    column = _balance_column(source)
+    while wanted > 0:
+        balance = db.session.query(column).filter(User.id == user_id).scalar() or 0
+        amount = min(balance, wanted)
+        if amount <= 0:
+            return 0
+        result = db.session.execute(
+            db.update(User)
+            .where(User.id == user_id, column >= amount)
+            .values({source: column - amount})
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            return amount
+    return 0
+
+
+def _give(user_id, source, amount):
+    column = _balance_column(source)
+    db.session.execute(
+        db.update(User)
+        .where(User.id == user_id)
+        .values({source: column + amount})
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _record(user_id, source, delta, reason, reference=None, created_at=None):
+    return {
+        "user_id": user_id,
+        "source": source,
+        "delta": delta,
+        "reason": reason,
+        "reference": reference,
+        "created_at": created_at or datetime.utcnow(),
+    }
+
+
+def debit_token(user_id, reason="automation_reply", reference=None):
+    """Spend one token, free before paid. Returns the source used, or None if the user has none left."""
+    try:
+        apply_due_token_reset(user_id)
+        for source in TOKEN_SOURCES:
+            if _take(user_id, source, 1):
+                db.session.execute(db.insert(TokenUsage), [_record(user_id, source, -1, reason, reference)])
+                db.session.commit()
+                return source
+        db.session.rollback()
+        return None
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def credit_tokens(user_id, source, amount, reason, reference=None):
+    """Atomically add tokens to a balance and record the grant or refund"""
+    try:
+        _give(user_id, source, amount)
+        db.session.execute(db.insert(TokenUsage), [_record(user_id, source, amount, reason, reference)])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+class TokenReservation:
+    """
+    Tokens taken from a user's balance up front for a batch of replies.
+
+    consume()/release() only touch in-memory counters, so a batch costs one
+    commit to reserve and one to reconcile no matter how many replies it sends.
+    reconcile() returns unused tokens and writes one ledger row per reply.
+    """
+
+    def __init__(self, user_id, reserved):
+        self.user_id = user_id
+        self.reserved = dict(reserved)
+        self.remaining = dict(reserved)
+        self.used = []
+
+    def consume(self, reference=None):
+        """Take one reserved token, free before paid; returns the source or None when exhausted"""
+        for source in TOKEN_SOURCES:
+            if self.remaining.get(source, 0) > 0:
+                self.remaining[source] -= 1
+                self.used.append((source, reference, datetime.utcnow()))
+                return source
+        return None
+
+    def release(self, source, reference=None):
+        """Give back a token whose reply failed"""
+        for i in range(len(self.used) - 1, -1, -1):
+            if self.used[i][0] == source and self.used[i][1] == reference:
+                del self.used[i]
+                self.remaining[source] += 1
+                return
+
+    def reconcile(self, reason="automation_reply"):
+        """Refund unused tokens and append the usage rows in one transaction"""
+        try:
+            for source, amount in self.remaining.items():
+                if amount > 0:
+                    _give(self.user_id, source, amount)
+            if self.used:
+                db.session.execute(db.insert(TokenUsage), [
+                    _record(self.user_id, source, -1, reason, reference, created_at)
+                    for source, reference, created_at in self.used
+                ])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        self.remaining = {source: 0 for source in self.remaining}
+
+
+def reserve_tokens(user_id, count):
+    """Reserve up to `count` tokens, free before paid; the reservation may hold fewer if the balance is short"""
+    reserved = {}
+    try:
+        apply_due_token_reset(user_id)
+        wanted = count
+        for source in TOKEN_SOURCES:
+            taken = _take(user_id, source, wanted) if wanted > 0 else 0
+            reserved[source] = taken
+            wanted -= taken
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return TokenReservation(user_id, reserved)
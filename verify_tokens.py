@@ -5,8 +5,9 @@ from datetime import datetime, timedelta
 # Add current directory to path so we can import app and models
 sys.path.append(os.getcwd())
 
-from app import app, db, handle_automation_trigger
+from app import app, db
 from models import User
+from plans import get_effective_balance, reset_due_tokens
 
 def test_token_system():
     with app.app_context():
@@ -47,10 +48,11 @@ def test_token_system():
         db.session.commit()
         print(f"Before reset check: Free={user.free_tokens}, Date={user.tokens_reset_at}")
 
-        # Import the helper manually if it's not exported, or just copy-paste the logic for test
-        from app import check_and_reset_tokens
-        check_and_reset_tokens(user)
-        print(f"After reset check: Free={user.free_tokens}, Date={user.tokens_reset_at}")
+        # Reads derive the reset without writing; the batch job persists it
+        print(f"Effective balance before batch reset: {get_effective_balance(user)}")
+        reset_due_tokens()
+        db.session.refresh(user)
+        print(f"After batch reset: Free={user.free_tokens}, Date={user.tokens_reset_at}")
 
         print("\n--- Step 4: Test Paid Token Consumption ---")
         user.free_tokens = 0
@@ -0,0 +1,220 @@
+"""
+Webhook Queue Module
+Durable SQLite-backed queue for Instagram webhook payloads. The webhook
+endpoint only appends; a pool of consumer threads drains it in batches.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+WEBHOOK_QUEUE_BATCH_SIZE = int(os.getenv('WEBHOOK_QUEUE_BATCH_SIZE', '50'))
+WEBHOOK_QUEUE_WORKERS = int(os.getenv('WEBHOOK_QUEUE_WORKERS', '2'))
+WEBHOOK_QUEUE_POLL_SECONDS = float(os.getenv('WEBHOOK_QUEUE_POLL_SECONDS', '1'))
+WEBHOOK_QUEUE_VISIBILITY_SECONDS = float(os.getenv('WEBHOOK_QUEUE_VISIBILITY_SECONDS', '300'))
+WEBHOOK_QUEUE_MAX_ATTEMPTS = int(os.getenv('WEBHOOK_QUEUE_MAX_ATTEMPTS', '5'))
+
+
+class WebhookQueue:
+    """
+    Append-only queue stored in its own SQLite file.
+
+    Rows are claimed by stamping `claimed_at` inside a BEGIN IMMEDIATE
+    transaction, so several consumers (threads or processes) never take the same
+    row. A claim that is not acked within the visibility timeout becomes
+    claimable again; consumers renew each claim right before processing the
+    event and ack it right after, so a slow batch only ever exposes the
+    events it has not started yet. Rows that fail `max_attempts` times are kept as dead
+    letters instead of being retried forever.
+    """
+
+    def __init__(self, path, visibility_timeout=WEBHOOK_QUEUE_VISIBILITY_SECONDS,
+                 max_attempts=WEBHOOK_QUEUE_MAX_ATTEMPTS):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+
+        self._stats_lock = threading.Lock()
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._total_lag = 0.0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._init_schema()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS webhook_event (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload TEXT NOT NULL,
+                received_at REAL NOT NULL,
+                claimed_at REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                dead INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_webhook_event_pending ON webhook_event (dead, claimed_at, id)")
+
+    def enqueue(self, payload):
+        """Append a raw JSON payload; this is the only work done on the request thread"""
+        self._connect().execute(
+            "INSERT INTO webhook_event (payload, received_at) VALUES (?, ?)",
+            (payload, time.time())
+        )
+        with self._stats_lock:
+            self.enqueued += 1
+
+    def claim_batch(self, limit=WEBHOOK_QUEUE_BATCH_SIZE):
+        """Claim up to `limit` pending events; returns a list of (id, payload, received_at, claimed_at)"""
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute('''
+                SELECT id, payload, received_at FROM webhook_event
+                WHERE dead = 0 AND (claimed_at IS NULL OR claimed_at < ?)
+                ORDER BY id LIMIT ?
+            ''', (now - self.visibility_timeout, limit)).fetchall()
+            if rows:
+                conn.executemany(
+                    "UPDATE webhook_event SET claimed_at = ?, attempts = attempts + 1 WHERE id = ?",
+                    [(now, row[0]) for row in rows]
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [row + (now,) for row in rows]
+
+    def renew(self, event):
+        """
+        Re-stamp a claimed event just before processing it. Returns False if
+        its claim expired and another consumer has reclaimed it since.
+        """
+        return self._connect().execute(
+            "UPDATE webhook_event SET claimed_at = ? WHERE id = ? AND claimed_at = ?",
+            (time.time(), event[0], event[3])
+        ).rowcount == 1
+
+    def ack(self, events):
+        """Delete successfully processed events and record their queue lag"""
+        if not events:
+            return
+        self._connect().executemany("DELETE FROM webhook_event WHERE id = ?", [(event[0],) for event in events])
+
+        now = time.time()
+        with self._stats_lock:
+            for event in events:
+                lag = now - event[2]
+                self.processed += 1
+                self._total_lag += lag
+                self.last_lag = lag
+                self.max_lag = max(self.max_lag, lag)
+
+    def fail(self, event_id, error):
+        """Release a failed event for retry, or mark it dead after max_attempts"""
+        self._connect().execute('''
+            UPDATE webhook_event
+            SET claimed_at = NULL, last_error = ?, dead = CASE WHEN attempts >= ? THEN 1 ELSE 0 END
+            WHERE id = ?
+        ''', (error, self.max_attempts, event_id))
+        with self._stats_lock:
+            self.failed += 1
+
+    def get_stats(self):
+        """Queue depth and processing lag metrics"""
+        pending, oldest, dead = self._connect().execute('''
+            SELECT
+                SUM(CASE WHEN dead = 0 THEN 1 ELSE 0 END),
+                MIN(CASE WHEN dead = 0 THEN received_at END),
+                SUM(dead)
+            FROM webhook_event
+        ''').fetchone()
+
+        with self._stats_lock:
+            return {
+                "depth": pending or 0,
+                "dead": dead or 0,
+                "oldest_pending_age": round(time.time() - oldest, 3) if oldest else 0.0,
+                "enqueued": self.enqueued,
+                "processed": self.processed,
+                "failed": self.failed,
+                "last_lag": round(self.last_lag, 3),
+                "max_lag": round(self.max_lag, 3),
+                "avg_lag": round(self._total_lag / self.processed, 3) if self.processed else 0.0,
+            }
+
+
+class WebhookConsumer:
+    """Pool of threads that drain a WebhookQueue in batches through `handler(payload_text)`"""
+
+    def __init__(self, queue, handler, workers=WEBHOOK_QUEUE_WORKERS,
+                 batch_size=WEBHOOK_QUEUE_BATCH_SIZE, poll_interval=WEBHOOK_QUEUE_POLL_SECONDS):
+        self.queue = queue
+        self.handler = handler
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        if any(thread.is_alive() for thread in self._threads):
+            return
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._run, name=f'webhook-consumer-{i}', daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                drained = self.drain_once()
+            except Exception as e:
+                print(f"Error draining webhook queue: {str(e)}")
+                drained = 0
+            # Only sleep when the queue is empty so bursts drain back-to-back
+            if not drained:
+                self._stop.wait(self.poll_interval)
+
+    def drain_once(self):
+        """Claim and process one batch; returns the number of events claimed"""
+        events = self.queue.claim_batch(self.batch_size)
+        for event in events:
+            # A long batch can outlive the visibility timeout; skip events another consumer took over
+            if not self.queue.renew(event):
+                continue
+            try:
+                self.handler(event[1])
+            except Exception as e:
+                print(f"Error processing webhook event {event[0]}: {str(e)}")
+                self.queue.fail(event[0], str(e))
+                continue
+            # Ack as soon as it succeeds so a later timeout can't hand it out again
+            self.queue.ack([event])
+        return len(events)